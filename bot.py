@@ -157,7 +157,7 @@ async def process_name(message: Message, state: FSMContext):
     calculation_message = await message.answer("🔮 Выполняю нумерологические расчеты... Пожалуйста, подождите.")
     
     # Выполнение нумерологических расчетов
-    numerology_results = calculate_numerology(birthdate, fio)
+    numerology_results = calculate_numerology(birthdate, fio).to_dict()
     
     # Сохранение результатов в БД
     report_id = await db.save_report(message.from_user.id, "mini", numerology_results)
@@ -363,13 +363,12 @@ async def process_successful_payment(message: Message):
     payload = payment.invoice_payload
     
     # Разбор payload
-    if ":" not in payload:
+    payload_type, sep, order_id_str = payload.partition(":")
+    if not sep:
         logger.error(f"Invalid payload format: {payload}")
         await message.answer("❌ Произошла ошибка при обработке платежа.")
         return
     
-    payload_type, order_id_str = payload.split(":", 1)
-    
     try:
         order_id = int(order_id_str)
     except ValueError:
@@ -9,6 +9,8 @@ from typing import Dict, Any, List, Optional, Union
 class Database:
     def __init__(self):
         self.pool = None
+        self._initialized = False
+        self._init_lock = asyncio.Lock()
         self.connection_params = {
             "user": os.getenv("POSTGRES_USER", "postgres"),
             "password": os.getenv("POSTGRES_PASSWORD", "postgres"),
@@ -19,24 +21,34 @@ class Database:
     
     async def init(self):
         """Инициализация соединения с базой данных"""
-        # Попытка подключения к базе данных с ожиданием готовности PostgreSQL
-        retries = 5
-        while retries > 0:
-            try:
-                self.pool = await asyncpg.create_pool(**self.connection_params)
-                # Проверяем работоспособность соединения
-                async with self.pool.acquire() as conn:
-                    await conn.execute("SELECT 1")
-                break
-            except (asyncpg.exceptions.PostgresError, OSError) as e:
-                retries -= 1
-                if retries == 0:
-                    raise e
-                print(f"Не удалось подключиться к базе данных. Повторная попытка через 5 секунд... ({e})")
-                await asyncio.sleep(5)
+        # Повторная инициализация не нужна: пул уже создан
+        if self._initialized:
+            return
         
-        # Проверяем наличие таблиц
-        await self._create_tables_if_not_exist()
+        # Одновременные вызовы init() ждут первый и не создают второй пул
+        async with self._init_lock:
+            if self._initialized:
+                return
+            
+            # Попытка подключения к базе данных с ожиданием готовности PostgreSQL
+            retries = 5
+            while retries > 0:
+                try:
+                    self.pool = await asyncpg.create_pool(**self.connection_params)
+                    # Проверяем работоспособность соединения
+                    async with self.pool.acquire() as conn:
+                        await conn.execute("SELECT 1")
+                    break
+                except (asyncpg.exceptions.PostgresError, OSError) as e:
+                    retries -= 1
+                    if retries == 0:
+                        raise e
+                    print(f"Не удалось подключиться к базе данных. Повторная попытка через 5 секунд... ({e})")
+                    await asyncio.sleep(5)
+            
+            # Проверяем наличие таблиц
+            await self._create_tables_if_not_exist()
+            self._initialized = True
     
     async def _create_tables_if_not_exist(self):
         """Создает таблицы, если они не существуют"""
@@ -388,4 +400,19 @@ class Database:
                 """
             )
             
+            return [dict(row) for row in rows]
+    
+    async def get_active_subscribers_with_users(self) -> List[Dict[str, Any]]:
+        """Получает активные подписки вместе с данными пользователей одним запросом"""
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                """
+                SELECT s.*, u.tg_id, u.fio, u.birthdate, u.push_enabled FROM subscriptions s
+                JOIN users u ON u.id = s.user_id
+                WHERE s.status IN ('active', 'trial') 
+                AND (s.trial_end IS NULL OR s.trial_end >= CURRENT_DATE)
+                AND COALESCE(u.push_enabled, true) = true
+                """
+            )
+            
             return [dict(row) for row in rows]
\ No newline at end of file
@@ -10,15 +10,27 @@ class Database:
     def __init__(self):
         self.db_file = "numerology_bot.db"
         self.connection = None
+        self._initialized = False
+        self._init_lock = asyncio.Lock()
         
     async def init(self):
         """Инициализация соединения с базой данных"""
-        # SQLite подключение (синхронное, но мы обернем его в асинхронные функции)
-        self.connection = sqlite3.connect(self.db_file)
-        self.connection.row_factory = sqlite3.Row
+        # Повторная инициализация не нужна: соединение уже открыто
+        if self._initialized:
+            return True
         
-        # Создаем таблицы если они не существуют
-        await self._create_tables_if_not_exist()
+        # Одновременные вызовы init() ждут первый и не открывают второе соединение
+        async with self._init_lock:
+            if self._initialized:
+                return True
+            
+            # SQLite подключение (синхронное, но мы обернем его в асинхронные функции)
+            self.connection = sqlite3.connect(self.db_file)
+            self.connection.row_factory = sqlite3.Row
+            
+            # Создаем таблицы если они не существуют
+            await self._create_tables_if_not_exist()
+            self._initialized = True
         return True
     
     async def _create_tables_if_not_exist(self):
@@ -344,4 +356,19 @@ class Database:
             """
         )
         rows = cursor.fetchall()
+        return [dict(row) for row in rows]
+    
+    async def get_active_subscribers_with_users(self) -> List[Dict[str, Any]]:
+        """Получает активные подписки вместе с данными пользователей одним запросом"""
+        cursor = self.connection.cursor()
+        cursor.execute(
+            """
+            SELECT s.*, u.tg_id, u.fio, u.birthdate, u.push_enabled FROM subscriptions s
+            JOIN users u ON u.id = s.user_id
+            WHERE s.status IN ('active', 'trial') 
+            AND (s.trial_end IS NULL OR date(s.trial_end) >= date('now'))
+            AND COALESCE(u.push_enabled, 1) = 1
+            """
+        )
+        rows = cursor.fetchall()
         return [dict(row) for row in rows]
\ No newline at end of file
@@ -13,6 +13,16 @@ import os
 import traceback
 from typing import Dict, Any, Optional, Union
 
+# orjson сериализует тело запроса заметно быстрее; без него используется стандартный json
+try:
+    import orjson
+    
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
 # Настройка логгирования
 logging.basicConfig(
     level=logging.INFO,
@@ -48,7 +58,71 @@ logger.info(f"EXPECT_TEXT_RESPONSE: {EXPECT_TEXT_RESPONSE}")
 logger.info(f"TEST_MODE: {TEST_MODE}")
 
 
-async def send_to_n8n(webhook_url: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+async def _post_to_webhook(session: aiohttp.ClientSession, actual_webhook_url: str, webhook_url: str,
+                           data: Dict[str, Any], headers: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """
+    Выполняет POST-запрос к webhook через переданную сессию и разбирает ответ.
+    """
+    # Тело запроса передается готовыми байтами, Content-Type задан в headers
+    async with session.post(
+        actual_webhook_url,
+        data=_dumps(data),
+        headers=headers,
+        timeout=REQUEST_TIMEOUT
+    ) as response:
+        status = response.status
+        logger.info(f"Получен ответ с кодом: {status}")
+        
+        if status == 200:
+            # Проверяем тип контента
+            content_type = response.headers.get('Content-Type', '')
+            
+            if 'application/json' in content_type:
+                # Пробуем распарсить JSON
+                try:
+                    result = await response.json()
+                    logger.info(f"Успешный JSON ответ от webhook")
+                    logger.debug(f"Структура ответа: {json.dumps(result, ensure_ascii=False, indent=2)}")
+                    return result
+                except Exception as json_error:
+                    logger.error(f"Ошибка при парсинге JSON: {json_error}")
+            
+            # Если ожидается текстовый ответ или не удалось распарсить JSON
+            if EXPECT_TEXT_RESPONSE or 'text/html' in content_type or 'text/plain' in content_type:
+                text = await response.text()
+                logger.info(f"Получен текстовый ответ: {text[:200]}...")
+                
+                # Форматируем текстовый ответ в структуру, ожидаемую ботом
+                report_type = data.get('report_type', 'unknown')
+                
+                if report_type == 'mini':
+                    return {"mini_report": text}
+                elif report_type == 'full':
+                    # Разбиваем текст на основные разделы для полного отчета
+                    full_report = parse_text_to_full_report(text)
+                    return {"full_report": full_report}
+                elif report_type == 'compatibility_mini':
+                    return {"compatibility_mini_report": text}
+                elif report_type == 'compatibility':
+                    # Разбиваем текст на основные разделы для отчета о совместимости
+                    compatibility_report = parse_text_to_compatibility_report(text)
+                    return {"compatibility_report": compatibility_report}
+                else:
+                    return {"message": text}
+            
+            logger.error(f"Неизвестный формат ответа")
+            return None
+        else:
+            error_text = await response.text()
+            logger.error(f"Ошибка от webhook: статус {status}, ответ: {error_text}")
+            
+            # Если ответ не успешный, генерируем тестовые данные вместо него
+            logger.warning("Использование тестовых данных из-за ошибки ответа")
+            return generate_test_response(webhook_url, data)
+
+
+async def send_to_n8n(webhook_url: str, data: Dict[str, Any],
+                      session: Optional[aiohttp.ClientSession] = None) -> Optional[Dict[str, Any]]:
     """
     Отправляет данные на webhook n8n или внешний webhook и возвращает ответ.
     В автономном режиме генерирует ответы локально.
@@ -56,6 +130,7 @@ async def send_to_n8n(webhook_url: str, data: Dict[str, Any]) -> Optional[Dict[s
     Args:
         webhook_url: URL вебхука (не используется при USE_EXTERNAL_WEBHOOK=True)
         data: Словарь с данными для отправки
+        session: Открытая сессия aiohttp для повторного использования соединений (необязательно)
         
     Returns:
         Ответ от webhook в виде словаря или локально сгенерированные данные
@@ -90,62 +165,11 @@ async def send_to_n8n(webhook_url: str, data: Dict[str, Any]) -> Optional[Dict[s
             "Accept": "application/json, text/plain, */*"  # Принимаем любой тип ответа
         }
         
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                actual_webhook_url,
-                json=data,
-                headers=headers,
-                timeout=REQUEST_TIMEOUT
-            ) as response:
-                status = response.status
-                logger.info(f"Получен ответ с кодом: {status}")
-                
-                if status == 200:
-                    # Проверяем тип контента
-                    content_type = response.headers.get('Content-Type', '')
-                    
-                    if 'application/json' in content_type:
-                        # Пробуем распарсить JSON
-                        try:
-                            result = await response.json()
-                            logger.info(f"Успешный JSON ответ от webhook")
-                            logger.debug(f"Структура ответа: {json.dumps(result, ensure_ascii=False, indent=2)}")
-                            return result
-                        except Exception as json_error:
-                            logger.error(f"Ошибка при парсинге JSON: {json_error}")
-                    
-                    # Если ожидается текстовый ответ или не удалось распарсить JSON
-                    if EXPECT_TEXT_RESPONSE or 'text/html' in content_type or 'text/plain' in content_type:
-                        text = await response.text()
-                        logger.info(f"Получен текстовый ответ: {text[:200]}...")
-                        
-                        # Форматируем текстовый ответ в структуру, ожидаемую ботом
-                        report_type = data.get('report_type', 'unknown')
-                        
-                        if report_type == 'mini':
-                            return {"mini_report": text}
-                        elif report_type == 'full':
-                            # Разбиваем текст на основные разделы для полного отчета
-                            full_report = parse_text_to_full_report(text)
-                            return {"full_report": full_report}
-                        elif report_type == 'compatibility_mini':
-                            return {"compatibility_mini_report": text}
-                        elif report_type == 'compatibility':
-                            # Разбиваем текст на основные разделы для отчета о совместимости
-                            compatibility_report = parse_text_to_compatibility_report(text)
-                            return {"compatibility_report": compatibility_report}
-                        else:
-                            return {"message": text}
-                    
-                    logger.error(f"Неизвестный формат ответа")
-                    return None
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Ошибка от webhook: статус {status}, ответ: {error_text}")
-                    
-                    # Если ответ не успешный, генерируем тестовые данные вместо него
-                    logger.warning("Использование тестовых данных из-за ошибки ответа")
-                    return generate_test_response(webhook_url, data)
+        # Общая сессия вызывающего кода переиспользует соединения; иначе создаем свою на один запрос
+        if session is not None:
+            return await _post_to_webhook(session, actual_webhook_url, webhook_url, data, headers)
+        async with aiohttp.ClientSession() as own_session:
+            return await _post_to_webhook(own_session, actual_webhook_url, webhook_url, data, headers)
                     
     except aiohttp.ClientError as e:
         logger.error(f"Ошибка подключения к webhook: {e}")
@@ -219,13 +243,15 @@ def parse_text_to_compatibility_report(text: str) -> Dict[str, Any]:
     return compatibility_report
 
 
-async def send_to_n8n_for_interpretation(data: Dict[str, Any], report_type: str) -> Dict[str, Any]:
+async def send_to_n8n_for_interpretation(data: Dict[str, Any], report_type: str,
+                                         session: Optional[aiohttp.ClientSession] = None) -> Dict[str, Any]:
     """
     Отправляет данные на интерпретацию через n8n или внешний webhook в зависимости от типа отчета.
     
     Args:
         data: Словарь с нумерологическими расчетами
         report_type: Тип отчета ('mini', 'full', 'compatibility_mini', 'compatibility')
+        session: Открытая сессия aiohttp для повторного использования соединений (необязательно)
         
     Returns:
         Словарь с результатами интерпретации или пустой словарь в случае ошибки
@@ -237,7 +263,7 @@ async def send_to_n8n_for_interpretation(data: Dict[str, Any], report_type: str)
         logger.info(f"Запрос интерпретации для отчета типа: {report_type}")
         
         # Отправляем запрос
-        result = await send_to_n8n("", request_data)
+        result = await send_to_n8n("", request_data, session=session)
         
         # Добавьте отладочный вывод
         logger.info(f"Получен ответ: {json.dumps(result, ensure_ascii=False)[:200] if result else 'None'}...")
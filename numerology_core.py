@@ -1,6 +1,101 @@
 # numerology_core.py - модуль для нумерологических расчетов
+from collections import Counter
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Any, List, Tuple
+from types import MappingProxyType
+from typing import Dict, Any, List, Mapping, Tuple
+
+# Таблица соответствия букв русского алфавита и чисел по системе Пифагора
+_RU_LETTERS = {
+    'а': 1, 'б': 2, 'в': 3, 'г': 4, 'д': 5, 'е': 6, 'ё': 7, 'ж': 8, 'з': 9,
+    'и': 1, 'й': 2, 'к': 3, 'л': 4, 'м': 5, 'н': 6, 'о': 7, 'п': 8, 'р': 9,
+    'с': 1, 'т': 2, 'у': 3, 'ф': 4, 'х': 5, 'ц': 6, 'ч': 7, 'ш': 8, 'щ': 9,
+    'ъ': 1, 'ы': 2, 'ь': 3, 'э': 4, 'ю': 5, 'я': 6
+}
+
+# Таблица соответствия букв английского алфавита и чисел по системе Пифагора
+_EN_LETTERS = {
+    'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5, 'f': 6, 'g': 7, 'h': 8, 'i': 9,
+    'j': 1, 'k': 2, 'l': 3, 'm': 4, 'n': 5, 'o': 6, 'p': 7, 'q': 8, 'r': 9,
+    's': 1, 't': 2, 'u': 3, 'v': 4, 'w': 5, 'x': 6, 'y': 7, 'z': 8
+}
+
+# Алфавиты не пересекаются, поэтому таблицы можно объединить в одну.
+# Таблицы только для чтения и общие для всех расчетов по ФИО
+_LETTERS: Mapping[str, int] = MappingProxyType({**_RU_LETTERS, **_EN_LETTERS})
+
+# Гласные (для числа души)
+_VOWELS: Mapping[str, int] = MappingProxyType({
+    'а': 1, 'е': 6, 'ё': 7, 'и': 1, 'о': 7, 'у': 3, 'ы': 2, 'э': 4, 'ю': 5, 'я': 6,
+    'a': 1, 'e': 5, 'i': 9, 'o': 6, 'u': 3, 'y': 7
+})
+
+# Согласные (для числа личности)
+_CONSONANTS: Mapping[str, int] = MappingProxyType({
+    'б': 2, 'в': 3, 'г': 4, 'д': 5, 'ж': 8, 'з': 9,
+    'й': 2, 'к': 3, 'л': 4, 'м': 5, 'н': 6, 'п': 8, 'р': 9,
+    'с': 1, 'т': 2, 'ф': 4, 'х': 5, 'ц': 6, 'ч': 7, 'ш': 8, 'щ': 9,
+    'ъ': 1, 'ь': 3,
+    'b': 2, 'c': 3, 'd': 4, 'f': 6, 'g': 7, 'h': 8,
+    'j': 1, 'k': 2, 'l': 3, 'm': 4, 'n': 5, 'p': 7, 'q': 8, 'r': 9,
+    's': 1, 't': 2, 'v': 4, 'w': 5, 'x': 6, 'z': 8
+})
+
+@dataclass(slots=True, frozen=True)
+class NumerologyResult:
+    """
+    Результат полного набора нумерологических расчетов.
+    Неизменяемый и хешируемый; для сохранения в БД и отправки в n8n
+    используйте to_dict().
+    """
+    life_path: int
+    expression: int
+    soul_urge: int
+    personality: int
+    destiny: int
+    karmic_lessons: Tuple[int, ...]
+    personal_year: int
+    # Частота цифр 1..9 в дате рождения
+    pythagoras_matrix: Tuple[int, ...]
+    day: int
+    month: int
+    year: int
+    fio: str
+    birthdate: str
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Возвращает результат в виде словаря (формат, сохраняемый в core_json).
+        """
+        return {
+            "life_path": self.life_path,
+            "expression": self.expression,
+            "soul_urge": self.soul_urge,
+            "personality": self.personality,
+            "destiny": self.destiny,
+            "karmic_lessons": list(self.karmic_lessons),
+            "personal_year": self.personal_year,
+            "pythagoras_matrix": {
+                str(digit): count for digit, count in enumerate(self.pythagoras_matrix, 1)
+            },
+            "birth_data": {
+                "date": self.birthdate,
+                "day": self.day,
+                "month": self.month,
+                "year": self.year
+            },
+            "fio": self.fio
+        }
+
+def _digit_sum_once(number: int) -> int:
+    """
+    Рассчитывает сумму цифр неотрицательного числа (один шаг, без преобразования в строку).
+    """
+    total = 0
+    while number:
+        number, digit = divmod(number, 10)
+        total += digit
+    return total
 
 def calculate_digit_sum(number: int) -> int:
     """
@@ -8,7 +103,7 @@ def calculate_digit_sum(number: int) -> int:
     Пример: 28 -> 2 + 8 = 10 -> 1 + 0 = 1
     """
     while number > 9:
-        number = sum(int(digit) for digit in str(number))
+        number = _digit_sum_once(number)
     return number
 
 def get_life_path_number(birthdate: str) -> int:
@@ -36,29 +131,7 @@ def get_expression_number(fio: str) -> int:
     Рассчитывает число выражения на основе ФИО.
     Используется система Пифагора для преобразования букв в числа.
     """
-    # Таблица соответствия букв русского алфавита и чисел по системе Пифагора
-    ru_letters = {
-        'а': 1, 'б': 2, 'в': 3, 'г': 4, 'д': 5, 'е': 6, 'ё': 7, 'ж': 8, 'з': 9,
-        'и': 1, 'й': 2, 'к': 3, 'л': 4, 'м': 5, 'н': 6, 'о': 7, 'п': 8, 'р': 9,
-        'с': 1, 'т': 2, 'у': 3, 'ф': 4, 'х': 5, 'ц': 6, 'ч': 7, 'ш': 8, 'щ': 9,
-        'ъ': 1, 'ы': 2, 'ь': 3, 'э': 4, 'ю': 5, 'я': 6
-    }
-    
-    # Таблица соответствия букв английского алфавита и чисел по системе Пифагора
-    en_letters = {
-        'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5, 'f': 6, 'g': 7, 'h': 8, 'i': 9,
-        'j': 1, 'k': 2, 'l': 3, 'm': 4, 'n': 5, 'o': 6, 'p': 7, 'q': 8, 'r': 9,
-        's': 1, 't': 2, 'u': 3, 'v': 4, 'w': 5, 'x': 6, 'y': 7, 'z': 8
-    }
-    
-    fio = fio.lower()
-    total = 0
-    
-    for char in fio:
-        if char in ru_letters:
-            total += ru_letters[char]
-        elif char in en_letters:
-            total += en_letters[char]
+    total = sum(_LETTERS.get(char, 0) for char in fio.lower())
     
     return calculate_digit_sum(total)
 
@@ -66,17 +139,7 @@ def get_soul_urge_number(fio: str) -> int:
     """
     Рассчитывает число души на основе гласных букв в ФИО.
     """
-    ru_vowels = {'а': 1, 'е': 6, 'ё': 7, 'и': 1, 'о': 7, 'у': 3, 'ы': 2, 'э': 4, 'ю': 5, 'я': 6}
-    en_vowels = {'a': 1, 'e': 5, 'i': 9, 'o': 6, 'u': 3, 'y': 7}
-    
-    fio = fio.lower()
-    total = 0
-    
-    for char in fio:
-        if char in ru_vowels:
-            total += ru_vowels[char]
-        elif char in en_vowels:
-            total += en_vowels[char]
+    total = sum(_VOWELS.get(char, 0) for char in fio.lower())
     
     return calculate_digit_sum(total)
 
@@ -84,26 +147,7 @@ def get_personality_number(fio: str) -> int:
     """
     Рассчитывает число личности на основе согласных букв в ФИО.
     """
-    ru_consonants = {
-        'б': 2, 'в': 3, 'г': 4, 'д': 5, 'ж': 8, 'з': 9,
-        'й': 2, 'к': 3, 'л': 4, 'м': 5, 'н': 6, 'п': 8, 'р': 9,
-        'с': 1, 'т': 2, 'ф': 4, 'х': 5, 'ц': 6, 'ч': 7, 'ш': 8, 'щ': 9,
-        'ъ': 1, 'ь': 3
-    }
-    en_consonants = {
-        'b': 2, 'c': 3, 'd': 4, 'f': 6, 'g': 7, 'h': 8,
-        'j': 1, 'k': 2, 'l': 3, 'm': 4, 'n': 5, 'p': 7, 'q': 8, 'r': 9,
-        's': 1, 't': 2, 'v': 4, 'w': 5, 'x': 6, 'z': 8
-    }
-    
-    fio = fio.lower()
-    total = 0
-    
-    for char in fio:
-        if char in ru_consonants:
-            total += ru_consonants[char]
-        elif char in en_consonants:
-            total += en_consonants[char]
+    total = sum(_CONSONANTS.get(char, 0) for char in fio.lower())
     
     return calculate_digit_sum(total)
 
@@ -117,34 +161,11 @@ def get_karmic_lessons(fio: str) -> List[int]:
     """
     Определяет кармические уроки на основе отсутствующих чисел в ФИО.
     """
-    ru_letters = {
-        'а': 1, 'б': 2, 'в': 3, 'г': 4, 'д': 5, 'е': 6, 'ё': 7, 'ж': 8, 'з': 9,
-        'и': 1, 'й': 2, 'к': 3, 'л': 4, 'м': 5, 'н': 6, 'о': 7, 'п': 8, 'р': 9,
-        'с': 1, 'т': 2, 'у': 3, 'ф': 4, 'х': 5, 'ц': 6, 'ч': 7, 'ш': 8, 'щ': 9,
-        'ъ': 1, 'ы': 2, 'ь': 3, 'э': 4, 'ю': 5, 'я': 6
-    }
-    
-    en_letters = {
-        'a': 1, 'b': 2, 'c': 3, 'd': 4, 'e': 5, 'f': 6, 'g': 7, 'h': 8, 'i': 9,
-        'j': 1, 'k': 2, 'l': 3, 'm': 4, 'n': 5, 'o': 6, 'p': 7, 'q': 8, 'r': 9,
-        's': 1, 't': 2, 'u': 3, 'v': 4, 'w': 5, 'x': 6, 'y': 7, 'z': 8
-    }
-    
-    # Счетчик для всех возможных чисел от 1 до 9
-    number_counts = {i: 0 for i in range(1, 10)}
-    
-    fio = fio.lower()
-    
-    for char in fio:
-        if char in ru_letters:
-            number = ru_letters[char]
-            number_counts[number] += 1
-        elif char in en_letters:
-            number = en_letters[char]
-            number_counts[number] += 1
+    # Гистограмма чисел от 1 до 9 за один проход по ФИО
+    number_counts = Counter(_LETTERS.get(char) for char in fio.lower())
     
     # Кармические уроки - это числа, которые отсутствуют в имени
-    karmic_lessons = [num for num, count in number_counts.items() if count == 0]
+    karmic_lessons = [num for num in range(1, 10) if number_counts[num] == 0]
     
     return karmic_lessons
 
@@ -163,7 +184,7 @@ def get_personal_year(birthdate: str) -> int:
     except ValueError:
         return 0
 
-def calculate_numerology(birthdate: str, fio: str) -> Dict[str, Any]:
+def calculate_numerology(birthdate: str, fio: str) -> NumerologyResult:
     """
     Выполняет полный набор нумерологических расчетов.
     """
@@ -182,26 +203,25 @@ def calculate_numerology(birthdate: str, fio: str) -> Dict[str, Any]:
     year_str = str(date_obj.year)
     date_digits = day_str + month_str + year_str
     
-    # Подсчет частоты каждой цифры
-    pythagoras_matrix = {str(i): date_digits.count(str(i)) for i in range(1, 10)}
+    # Подсчет частоты каждой цифры за один проход
+    digit_counts = Counter(date_digits)
+    pythagoras_matrix = tuple(digit_counts[str(i)] for i in range(1, 10))
     
-    return {
-        "life_path": life_path,
-        "expression": expression,
-        "soul_urge": soul_urge,
-        "personality": personality,
-        "destiny": destiny,
-        "karmic_lessons": karmic_lessons,
-        "personal_year": personal_year,
-        "pythagoras_matrix": pythagoras_matrix,
-        "birth_data": {
-            "date": birthdate,
-            "day": date_obj.day,
-            "month": date_obj.month,
-            "year": date_obj.year
-        },
-        "fio": fio
-    }
+    return NumerologyResult(
+        life_path=life_path,
+        expression=expression,
+        soul_urge=soul_urge,
+        personality=personality,
+        destiny=destiny,
+        karmic_lessons=tuple(karmic_lessons),
+        personal_year=personal_year,
+        pythagoras_matrix=pythagoras_matrix,
+        day=date_obj.day,
+        month=date_obj.month,
+        year=date_obj.year,
+        fio=fio,
+        birthdate=birthdate
+    )
 
 def calculate_compatibility(
     birthdate1: str, fio1: str,
@@ -215,16 +235,16 @@ def calculate_compatibility(
     
     # Расчет базовой совместимости (от 1 до 10)
     # На основе сравнения жизненных путей
-    life_path_compatibility = 10 - abs(person1["life_path"] - person2["life_path"])
+    life_path_compatibility = 10 - abs(person1.life_path - person2.life_path)
     
     # Расчет эмоциональной совместимости
-    emotional_compatibility = 10 - abs(person1["soul_urge"] - person2["soul_urge"])
+    emotional_compatibility = 10 - abs(person1.soul_urge - person2.soul_urge)
     
     # Расчет интеллектуальной совместимости
-    intellectual_compatibility = 10 - abs(person1["expression"] - person2["expression"])
+    intellectual_compatibility = 10 - abs(person1.expression - person2.expression)
     
     # Расчет физической совместимости
-    physical_compatibility = 10 - abs(person1["personality"] - person2["personality"])
+    physical_compatibility = 10 - abs(person1.personality - person2.personality)
     
     # Общая совместимость (средневзвешенное)
     total_compatibility = (
@@ -236,19 +256,19 @@ def calculate_compatibility(
     
     # Расчет кармической связи
     karmic_connection = False
-    if person1["life_path"] == person2["life_path"]:
+    if person1.life_path == person2.life_path:
         karmic_connection = True
     
     # Расчет потенциальных сложностей
     challenges = []
-    if abs(person1["life_path"] - person2["life_path"]) > 5:
+    if abs(person1.life_path - person2.life_path) > 5:
         challenges.append("Разные жизненные пути")
-    if abs(person1["soul_urge"] - person2["soul_urge"]) > 5:
+    if abs(person1.soul_urge - person2.soul_urge) > 5:
         challenges.append("Разные эмоциональные потребности")
     
     return {
-        "person1": person1,
-        "person2": person2,
+        "person1": person1.to_dict(),
+        "person2": person2.to_dict(),
         "compatibility": {
             "life_path": life_path_compatibility,
             "emotional": emotional_compatibility,
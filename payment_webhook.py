@@ -3,6 +3,7 @@
 Предоставляет функции для проверки и обработки платежей.
 """
 
+import asyncio
 import logging
 import json
 import hmac
@@ -56,7 +57,7 @@ async def verify_telegram_payment(request):
             
         return True
     except Exception as e:
-        logger.error(f"Error verifying payment: {e}")
+        logger.error("Error verifying payment: %s", e)
         return False
 
 
@@ -71,9 +72,6 @@ async def handle_successful_payment(payment_data: Dict[str, Any]) -> bool:
         bool: True если обработка прошла успешно, False в противном случае
     """
     try:
-        # Инициализация базы данных
-        await db.init()
-        
         # Извлечение необходимых данных
         telegram_payment_charge_id = payment_data.get('telegram_payment_charge_id')
         provider_payment_charge_id = payment_data.get('provider_payment_charge_id')
@@ -87,47 +85,57 @@ async def handle_successful_payment(payment_data: Dict[str, Any]) -> bool:
         payload_str = payment_data['invoice_payload']
         
         # Проверяем формат payload (должен быть 'order:123' или 'subscription:123')
-        if ":" not in payload_str:
-            logger.error(f"Invalid payload format: {payload_str}")
+        payload_type, sep, order_id_str = payload_str.partition(":")
+        if not sep:
+            logger.error("Invalid payload format: %s", payload_str)
             return False
-            
-        payload_type, order_id_str = payload_str.split(":", 1)
         
         try:
             order_id = int(order_id_str)
         except ValueError:
-            logger.error(f"Invalid order ID in payload: {order_id_str}")
+            logger.error("Invalid order ID in payload: %s", order_id_str)
             return False
         
         # Получение заказа из БД
         order = await db.get_order(order_id)
         if not order:
-            logger.error(f"Order not found: {order_id}")
+            logger.error("Order not found: %s", order_id)
             return False
             
-        # Обновление статуса заказа в БД
-        await db.update_order_status(order_id, 'paid')
-        
-        # Обработка различных типов продуктов
-        if order['product'] == 'full_report':
-            # Генерация и отправка PDF отчета
-            await process_full_report_payment(order)
-            
-        elif order['product'] == 'compatibility':
-            # Генерация и отправка отчета о совместимости
-            await process_compatibility_payment(order)
-            
-        elif order['product'] == 'subscription_month':
-            # Активация подписки
-            await process_subscription_payment(order)
+        # Обновление статуса заказа в БД и обработка продукта не зависят
+        # друг от друга (заказ уже получен), поэтому выполняем их параллельно
+        await asyncio.gather(
+            db.update_order_status(order_id, 'paid'),
+            _dispatch_product(order)
+        )
         
         return True
         
     except Exception as e:
-        logger.error(f"Error processing successful payment: {e}")
+        logger.error("Error processing successful payment: %s", e)
         return False
 
 
+async def _dispatch_product(order: Dict[str, Any]):
+    """
+    Запускает обработку оплаченного заказа в зависимости от типа продукта.
+    
+    Args:
+        order: Данные заказа
+    """
+    if order['product'] == 'full_report':
+        # Генерация и отправка PDF отчета
+        await process_full_report_payment(order)
+        
+    elif order['product'] == 'compatibility':
+        # Генерация и отправка отчета о совместимости
+        await process_compatibility_payment(order)
+        
+    elif order['product'] == 'subscription_month':
+        # Активация подписки
+        await process_subscription_payment(order)
+
+
 async def process_full_report_payment(order: Dict[str, Any]):
     """
     Обрабатывает оплату полного отчета.
@@ -137,7 +145,7 @@ async def process_full_report_payment(order: Dict[str, Any]):
     """
     # Здесь должен быть код для генерации и отправки PDF-отчета
     # В рамках этого файла мы только логируем событие
-    logger.info(f"Processing full report payment for order: {order['id']}")
+    logger.info("Processing full report payment for order: %s", order['id'])
     
     # В реальном коде здесь должен быть вызов функций из bot.py для отправки отчета
 
@@ -149,7 +157,7 @@ async def process_compatibility_payment(order: Dict[str, Any]):
     Args:
         order: Данные заказа
     """
-    logger.info(f"Processing compatibility report payment for order: {order['id']}")
+    logger.info("Processing compatibility report payment for order: %s", order['id'])
     
     # В реальном коде здесь должен быть вызов функций из bot.py для отправки отчета
 
@@ -161,7 +169,7 @@ async def process_subscription_payment(order: Dict[str, Any]):
     Args:
         order: Данные заказа
     """
-    logger.info(f"Processing subscription payment for order: {order['id']}")
+    logger.info("Processing subscription payment for order: %s", order['id'])
     
     # Активация подписки в БД
     now = datetime.now().date()
@@ -190,10 +198,16 @@ async def handle_payment_webhook(request: web.Request) -> web.Response:
     if not await verify_telegram_payment(request):
         return web.Response(status=401, text="Unauthorized")
         
+    # Получение данных запроса; некорректный JSON - ошибка клиента,
+    # повторная отправка того же тела ничего не изменит
     try:
-        # Получение данных запроса
         data = await request.json()
-        logger.info(f"Received payment webhook: {data}")
+    except json.JSONDecodeError:
+        logger.warning("Malformed JSON in payment webhook")
+        return web.Response(status=400, text="Bad Request")
+        
+    try:
+        logger.info("Received payment webhook: %s", data)
         
         # В тестовом режиме всегда возвращаем успешный ответ
         if TEST_MODE:
@@ -214,9 +228,13 @@ async def handle_payment_webhook(request: web.Request) -> web.Response:
         # Обрабатываем другие типы уведомлений
         return web.Response(status=200, text="Notification received")
         
-    except Exception as e:
-        logger.error(f"Error in payment webhook handler: {e}")
-        return web.Response(status=500, text=f"Error: {str(e)}")
+    except (KeyError, TypeError, AttributeError) as e:
+        # Неожиданная структура уведомления
+        logger.warning("Invalid payment webhook payload: %r", e)
+        return web.Response(status=400, text="Bad Request")
+    except Exception:
+        logger.exception("Error in payment webhook handler")
+        return web.Response(status=500, text="Internal Server Error")
 
 
 async def setup_payment_webhook_server(host='0.0.0.0', port=8080):
@@ -237,7 +255,7 @@ async def setup_payment_webhook_server(host='0.0.0.0', port=8080):
     await runner.setup()
     site = web.TCPSite(runner, host, port)
     
-    logger.info(f"Starting payment webhook server on {host}:{port}")
+    logger.info("Starting payment webhook server on %s:%s", host, port)
     await site.start()
     
     return runner
\ No newline at end of file
@@ -3,6 +3,7 @@
 Предоставляет функции для проверки и обработки платежей.
 """
 
+import asyncio
 import logging
 import json
 import hmac
@@ -10,7 +11,7 @@ import hashlib
 import os
 from aiohttp import web
 from datetime import datetime, timedelta
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
 # Импортируем необходимые модули
 try:
@@ -29,52 +30,56 @@ logger = logging.getLogger(__name__)
 YUKASSA_SECRET_KEY = os.getenv("YUKASSA_SECRET_KEY", "your_yukassa_secret_key")
 TEST_MODE = os.getenv("TEST_MODE", "false").lower() == "true"
 
+# Размер блока при потоковом чтении тела уведомления
+BODY_CHUNK_SIZE = 8192
+
 # Инициализация базы данных
 db = Database()
 
 
-async def verify_yukassa_payment(request):
+async def verify_yukassa_payment(request) -> Tuple[bool, Optional[bytes]]:
     """
     Проверяет подлинность вебхука от ЮKassa.
     
+    Тело запроса читается потоково: каждый блок сразу передается в HMAC
+    и накапливается для последующего разбора JSON.
+    
     Args:
         request: aiohttp Request объект
         
     Returns:
-        bool: True если вебхук подлинный, False в противном случае
+        Tuple[bool, Optional[bytes]]: (True, тело запроса) если вебхук подлинный,
+        (False, None) в противном случае
     """
-    # В тестовом режиме всегда возвращаем True
+    # В тестовом режиме подпись не проверяем
     if TEST_MODE:
-        return True
+        return True, await request.read()
         
     try:
         # Проверка наличия заголовка X-Signature
         if 'X-Signature' not in request.headers:
             logger.warning("Missing X-Signature header")
-            return False
+            return False, None
         
         # Получение подписи из заголовка
         signature = request.headers['X-Signature']
         
-        # Получение тела запроса
-        body = await request.read()
-        
-        # Вычисление HMAC-SHA256 подписи
-        calculated_signature = hmac.new(
-            YUKASSA_SECRET_KEY.encode(),
-            body,
-            hashlib.sha256
-        ).hexdigest()
+        # Вычисление HMAC-SHA256 подписи по мере чтения тела запроса
+        mac = hmac.new(YUKASSA_SECRET_KEY.encode(), digestmod=hashlib.sha256)
+        body = bytearray()
+        async for chunk in request.content.iter_chunked(BODY_CHUNK_SIZE):
+            mac.update(chunk)
+            body.extend(chunk)
         
         # Проверка подписи
-        if not hmac.compare_digest(signature, calculated_signature):
+        if not hmac.compare_digest(signature, mac.hexdigest()):
             logger.warning("Invalid signature")
-            return False
+            return False, None
             
-        return True
+        return True, bytes(body)
     except Exception as e:
-        logger.error(f"Error verifying payment: {e}")
-        return False
+        logger.error("Error verifying payment: %s", e)
+        return False, None
 
 
 async def handle_successful_payment(payment_data: Dict[str, Any]) -> bool:
@@ -88,12 +93,9 @@ async def handle_successful_payment(payment_data: Dict[str, Any]) -> bool:
         bool: True если обработка прошла успешно, False в противном случае
     """
     try:
-        # Инициализация базы данных
-        await db.init()
-        
         # Проверяем статус платежа
         if payment_data.get('status') != 'succeeded':
-            logger.info(f"Payment not succeeded, status: {payment_data.get('status')}")
+            logger.info("Payment not succeeded, status: %s", payment_data.get('status'))
             return False
         
         # Извлечение необходимых данных
@@ -112,38 +114,49 @@ async def handle_successful_payment(payment_data: Dict[str, Any]) -> bool:
         try:
             order_id = int(order_id)
         except ValueError:
-            logger.error(f"Invalid order ID in metadata: {order_id}")
+            logger.error("Invalid order ID in metadata: %s", order_id)
             return False
         
         # Получение заказа из БД
         order = await db.get_order(order_id)
         if not order:
-            logger.error(f"Order not found: {order_id}")
+            logger.error("Order not found: %s", order_id)
             return False
             
-        # Обновление статуса заказа в БД
-        await db.update_order_status(order_id, 'paid')
-        
-        # Обработка различных типов продуктов
-        if order['product'] == 'full_report':
-            # Генерация и отправка PDF отчета
-            await process_full_report_payment(order)
-            
-        elif order['product'] == 'compatibility':
-            # Генерация и отправка отчета о совместимости
-            await process_compatibility_payment(order)
-            
-        elif order['product'] == 'subscription_month':
-            # Активация подписки
-            await process_subscription_payment(order)
+        # Обновление статуса заказа в БД и обработка продукта не зависят
+        # друг от друга (заказ уже получен), поэтому выполняем их параллельно
+        await asyncio.gather(
+            db.update_order_status(order_id, 'paid'),
+            _dispatch_product(order)
+        )
         
         return True
         
     except Exception as e:
-        logger.error(f"Error processing successful payment: {e}")
+        logger.error("Error processing successful payment: %s", e)
         return False
 
 
+async def _dispatch_product(order: Dict[str, Any]):
+    """
+    Запускает обработку оплаченного заказа в зависимости от типа продукта.
+    
+    Args:
+        order: Данные заказа
+    """
+    if order['product'] == 'full_report':
+        # Генерация и отправка PDF отчета
+        await process_full_report_payment(order)
+        
+    elif order['product'] == 'compatibility':
+        # Генерация и отправка отчета о совместимости
+        await process_compatibility_payment(order)
+        
+    elif order['product'] == 'subscription_month':
+        # Активация подписки
+        await process_subscription_payment(order)
+
+
 async def process_full_report_payment(order: Dict[str, Any]):
     """
     Обрабатывает оплату полного отчета.
@@ -153,7 +166,7 @@ async def process_full_report_payment(order: Dict[str, Any]):
     """
     # Здесь должен быть код для генерации и отправки PDF-отчета
     # В рамках этого файла мы только логируем событие
-    logger.info(f"Processing full report payment for order: {order['id']}")
+    logger.info("Processing full report payment for order: %s", order['id'])
     
     # В реальном коде здесь должен быть вызов функций из bot.py для отправки отчета
 
@@ -165,7 +178,7 @@ async def process_compatibility_payment(order: Dict[str, Any]):
     Args:
         order: Данные заказа
     """
-    logger.info(f"Processing compatibility report payment for order: {order['id']}")
+    logger.info("Processing compatibility report payment for order: %s", order['id'])
     
     # В реальном коде здесь должен быть вызов функций из bot.py для отправки отчета
 
@@ -177,7 +190,7 @@ async def process_subscription_payment(order: Dict[str, Any]):
     Args:
         order: Данные заказа
     """
-    logger.info(f"Processing subscription payment for order: {order['id']}")
+    logger.info("Processing subscription payment for order: %s", order['id'])
     
     # Активация подписки в БД
     now = datetime.now().date()
@@ -202,14 +215,21 @@ async def handle_payment_webhook(request: web.Request) -> web.Response:
     Returns:
         aiohttp.web.Response
     """
-    # Проверка подлинности вебхука
-    if not await verify_yukassa_payment(request):
+    # Проверка подлинности вебхука (тело запроса уже прочитано при проверке)
+    is_valid, body = await verify_yukassa_payment(request)
+    if not is_valid:
         return web.Response(status=401, text="Unauthorized")
         
+    # Получение данных запроса; некорректный JSON - ошибка клиента,
+    # повторная отправка того же тела ничего не изменит
     try:
-        # Получение данных запроса
-        data = await request.json()
-        logger.info(f"Received payment webhook: {data}")
+        data = json.loads(body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        logger.warning("Malformed JSON in payment webhook")
+        return web.Response(status=400, text="Bad Request")
+        
+    try:
+        logger.info("Received payment webhook: %s", data)
         
         # В тестовом режиме всегда возвращаем успешный ответ
         if TEST_MODE:
@@ -229,9 +249,13 @@ async def handle_payment_webhook(request: web.Request) -> web.Response:
         # Обрабатываем другие типы уведомлений
         return web.Response(status=200, text="Notification received")
         
-    except Exception as e:
-        logger.error(f"Error in payment webhook handler: {e}")
-        return web.Response(status=500, text=f"Error: {str(e)}")
+    except (KeyError, TypeError, AttributeError) as e:
+        # Неожиданная структура уведомления
+        logger.warning("Invalid payment webhook payload: %r", e)
+        return web.Response(status=400, text="Bad Request")
+    except Exception:
+        logger.exception("Error in payment webhook handler")
+        return web.Response(status=500, text="Internal Server Error")
 
 
 async def setup_payment_webhook_server(host='0.0.0.0', port=8080):
@@ -252,7 +276,7 @@ async def setup_payment_webhook_server(host='0.0.0.0', port=8080):
     await runner.setup()
     site = web.TCPSite(runner, host, port)
     
-    logger.info(f"Starting payment webhook server on {host}:{port}")
+    logger.info("Starting payment webhook server on %s:%s", host, port)
     await site.start()
     
     return runner
@@ -4,13 +4,18 @@
 """
 
 import os
+import asyncio
+import functools
 import logging
 import shutil
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
 import re
-from typing import Dict, Any, Optional, Union
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
 import jinja2
 from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
 
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
@@ -33,20 +38,63 @@ logger = logging.getLogger(__name__)
 
 # Путь к HTML-шаблону и директории для сохранения отчетов
 TEMPLATE_FILE = 'pdf_template.html'
+STYLE_FILE = 'report.css'
 PDF_STORAGE_PATH = os.environ.get('PDF_STORAGE_PATH', './pdfs')
+JINJA_CACHE_PATH = os.path.join(PDF_STORAGE_PATH, '.jinja_cache')
+
+# Режим отладки: шаблон перечитывается при изменении файла
+DEBUG = os.environ.get('DEBUG', 'false').lower() == 'true'
 
 # Создаем директорию для хранения отчетов, если она не существует
 os.makedirs(PDF_STORAGE_PATH, exist_ok=True)
+os.makedirs(JINJA_CACHE_PATH, exist_ok=True)
+
+# Окружение Jinja2 создается один раз на процесс: загрузчик и скомпилированные
+# шаблоны переиспользуются всеми вызовами generate_pdf. Без DEBUG файл шаблона
+# не проверяется на изменения, а байткод сохраняется на диск между перезапусками
+_ENV = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(searchpath="./"),
+    cache_size=64,
+    auto_reload=DEBUG,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(directory=JINJA_CACHE_PATH)
+)
+
+# Конфигурация шрифтов WeasyPrint создается один раз на процесс, чтобы шрифты
+# не разрешались заново при каждой генерации
+_FONT_CONFIG = FontConfiguration()
+
+# Таблица стилей отчета разбирается один раз при импорте и передается
+# в WeasyPrint готовым объектом, а не извлекается из шаблона при каждой генерации
+try:
+    _STYLE = CSS(filename=STYLE_FILE, font_config=_FONT_CONFIG)
+except Exception as e:
+    logger.error(f"Не удалось загрузить стили {STYLE_FILE}: {e}")
+    _STYLE = None
+_STYLESHEETS = [_STYLE] if _STYLE is not None else None
+
+# Разделители текстового отчета
+SEP_EQ_LINE = '=' * 50
+SEP_DASH_LINE = '-' * 40
+
+# Размеры буферов при записи отчетов: текст и HTML - 128 КиБ, PDF - 256 КиБ
+TEXT_BUFFER_SIZE = 1 << 17
+PDF_BUFFER_SIZE = 1 << 18
+
+# Пул потоков для генерации PDF из асинхронного кода бота
+_PDF_POOL = ThreadPoolExecutor(max_workers=max(2, (os.cpu_count() or 2) // 2), thread_name_prefix='pdf')
+
+# Директории пользователей, уже созданные этим процессом
+_KNOWN_DIRS: Set[str] = set()
+
+# Недопустимые в имени файла символы и пробел
+_SANITIZE_RE = re.compile(r'[\\/*?:"<>| ]')
 
 def sanitize_filename(filename: str) -> str:
     """
     Очищает имя файла от недопустимых символов
     """
-    # Заменяем недопустимые символы на нижнее подчеркивание
-    sanitized = re.sub(r'[\\/*?:"<>|]', '_', filename)
-    # Заменяем пробелы на нижнее подчеркивание
-    sanitized = sanitized.replace(' ', '_')
-    return sanitized
+    # Заменяем недопустимые символы и пробелы на нижнее подчеркивание за один проход
+    return _SANITIZE_RE.sub('_', filename)
 
 def get_user_directory(user_data: Dict[str, Any]) -> str:
     """
@@ -59,74 +107,85 @@ def get_user_directory(user_data: Dict[str, Any]) -> str:
     # Создаем путь к директории пользователя
     user_dir = os.path.join(PDF_STORAGE_PATH, sanitized_name)
     
-    # Создаем директорию, если она не существует
-    os.makedirs(user_dir, exist_ok=True)
+    # Создаем директорию, если она не существует (для известных путей пропускаем)
+    if user_dir not in _KNOWN_DIRS:
+        os.makedirs(user_dir, exist_ok=True)
+        _KNOWN_DIRS.add(user_dir)
     
     return user_dir
 
+# Базовый шаблон на случай, если файл TEMPLATE_FILE не найден
+BASIC_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="UTF-8">
+    <title>Нумерологический отчет</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 40px; }
+        h1 { color: #4b0082; text-align: center; }
+        h2 { color: #4b0082; border-bottom: 1px solid #ddd; }
+        .number { font-size: 24px; font-weight: bold; color: #4b0082; }
+        .section { margin: 20px 0; }
+        footer { margin-top: 50px; text-align: center; font-size: 12px; color: #666; }
+    </style>
+</head>
+<body>
+    <h1>Нумерологический отчет для {{ user_name }}</h1>
+    <p>Дата рождения: {{ birthdate }}</p>
+    <p>Дата составления: {{ current_date }}</p>
+
+    <div class="section">
+        <h2>Ключевые числа вашей судьбы</h2>
+        <p><span class="number">{{ life_path_number }}</span> - Число жизненного пути<br>{{ life_path_interpretation }}</p>
+        <p><span class="number">{{ expression_number }}</span> - Число выражения<br>{{ expression_interpretation }}</p>
+        <p><span class="number">{{ soul_number }}</span> - Число души<br>{{ soul_interpretation }}</p>
+        <p><span class="number">{{ personality_number }}</span> - Число личности<br>{{ personality_interpretation }}</p>
+    </div>
+
+    <div class="section">
+        <h2>Прогноз и рекомендации</h2>
+        <p>{{ forecast }}</p>
+        <p>{{ recommendations }}</p>
+    </div>
+
+    <footer>
+        <p>© ИИ-Нумеролог {{ current_year }}. Все права защищены.</p>
+    </footer>
+</body>
+</html>
+"""
+
+
+@functools.lru_cache(maxsize=1)
+def _get_basic_template() -> jinja2.Template:
+    """
+    Компилирует базовый шаблон из памяти (один раз на процесс).
+    """
+    return _ENV.from_string(BASIC_TEMPLATE)
+
+
 def get_jinja_template():
     """
     Получает объект шаблона Jinja2 для генерации HTML.
+    Шаблон компилируется один раз, последующие вызовы возвращают его из кеша
+    окружения (в режиме DEBUG - перечитывают при изменении файла).
     
     Returns:
         jinja2.Template: Объект шаблона Jinja2
     """
-    template_loader = jinja2.FileSystemLoader(searchpath="./")
-    template_env = jinja2.Environment(loader=template_loader)
     try:
-        template = template_env.get_template(TEMPLATE_FILE)
+        template = _ENV.get_template(TEMPLATE_FILE)
         return template
     except jinja2.exceptions.TemplateNotFound:
         logger.error(f"Шаблон {TEMPLATE_FILE} не найден")
-        # Создаем базовый шаблон, если основной не найден
-        basic_template = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="UTF-8">
-            <title>Нумерологический отчет</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 40px; }
-                h1 { color: #4b0082; text-align: center; }
-                h2 { color: #4b0082; border-bottom: 1px solid #ddd; }
-                .number { font-size: 24px; font-weight: bold; color: #4b0082; }
-                .section { margin: 20px 0; }
-                footer { margin-top: 50px; text-align: center; font-size: 12px; color: #666; }
-            </style>
-        </head>
-        <body>
-            <h1>Нумерологический отчет для {{ user_name }}</h1>
-            <p>Дата рождения: {{ birthdate }}</p>
-            <p>Дата составления: {{ current_date }}</p>
-            
-            <div class="section">
-                <h2>Ключевые числа вашей судьбы</h2>
-                <p><span class="number">{{ life_path_number }}</span> - Число жизненного пути<br>{{ life_path_interpretation }}</p>
-                <p><span class="number">{{ expression_number }}</span> - Число выражения<br>{{ expression_interpretation }}</p>
-                <p><span class="number">{{ soul_number }}</span> - Число души<br>{{ soul_interpretation }}</p>
-                <p><span class="number">{{ personality_number }}</span> - Число личности<br>{{ personality_interpretation }}</p>
-            </div>
-            
-            <div class="section">
-                <h2>Прогноз и рекомендации</h2>
-                <p>{{ forecast }}</p>
-                <p>{{ recommendations }}</p>
-            </div>
-            
-            <footer>
-                <p>© ИИ-Нумеролог {{ current_year }}. Все права защищены.</p>
-            </footer>
-        </body>
-        </html>
-        """
-        # Создаем временный шаблон в файле
-        with open("temp_template.html", "w", encoding="utf-8") as temp_file:
-            temp_file.write(basic_template)
-        return template_env.get_template("temp_template.html")
+        # Используем базовый шаблон, если основной не найден
+        return _get_basic_template()
 
 
 def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any], 
-                interpretation_data: Dict[str, Any], report_type: str = 'full') -> Optional[str]:
+                interpretation_data: Dict[str, Any], report_type: str = 'full',
+                also_write_text: bool = False) -> Optional[str]:
     """
     Генерирует PDF-отчет на основе шаблона и данных.
     
@@ -135,6 +194,8 @@ def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
         numerology_data: Результаты нумерологических расчетов
         interpretation_data: Интерпретация результатов от ИИ
         report_type: Тип отчета ('full' или 'compatibility')
+        also_write_text: Сохранять ли текстовую копию отчета рядом с PDF
+            (при ошибке генерации PDF текстовый отчет создается всегда)
         
     Returns:
         str: Путь к сгенерированному PDF-файлу или None в случае ошибки
@@ -147,13 +208,14 @@ def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
         birthdate_formatted = format_date(user_data.get('birthdate', ''))
         
         # Подготавливаем данные для шаблона
-        template_data = prepare_template_data(user_data, numerology_data, interpretation_data, birthdate_formatted, report_type)
+        now = datetime.now()
+        template_data = prepare_template_data(user_data, numerology_data, interpretation_data, birthdate_formatted, report_type, now)
         
         # Получаем шаблон
         template = get_jinja_template()
         
         # Формируем имя файла для PDF и текстового отчета
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        timestamp = now.strftime('%Y%m%d_%H%M%S')
         file_prefix = f"{report_type}"
         pdf_filename = f"{file_prefix}_{timestamp}.pdf"
         txt_filename = f"{file_prefix}_{timestamp}.txt"
@@ -161,31 +223,36 @@ def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
         pdf_path = os.path.join(user_dir, pdf_filename)
         txt_path = os.path.join(user_dir, txt_filename)
         
-        # Генерируем HTML на основе шаблона
+        # Генерируем HTML на основе шаблона без промежуточного файла
         html_content = template.render(**template_data)
-        
-        # Сначала сохраняем HTML во временный файл (для отладки)
-        temp_html_path = os.path.join(user_dir, f"{file_prefix}_{timestamp}.html")
-        with open(temp_html_path, 'w', encoding='utf-8') as html_file:
-            html_file.write(html_content)
+        if DEBUG:
+            # В режиме отладки сохраняем HTML в файл одной записью
+            temp_html_path = os.path.join(user_dir, f"{file_prefix}_{timestamp}.html")
+            Path(temp_html_path).write_bytes(html_content.encode('utf-8'))
+        html_document = HTML(string=html_content)
         
         try:
             # Генерируем PDF
-            HTML(string=html_content).write_pdf(pdf_path)
+            with open(pdf_path, 'wb', buffering=PDF_BUFFER_SIZE) as pdf_file:
+                html_document.write_pdf(pdf_file, stylesheets=_STYLESHEETS, font_config=_FONT_CONFIG, optimize_images=True, jpeg_quality=80)
             logger.info(f"PDF отчет успешно сгенерирован: {pdf_path}")
         except Exception as pdf_error:
             logger.error(f"Ошибка при генерации PDF: {pdf_error}")
+            # Файл открывается до верстки, поэтому удаляем недописанный PDF
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
             logger.info("Пробуем альтернативный способ генерации PDF...")
             try:
                 # Альтернативный способ без weasyprint - создаем только текстовый отчет
-                generate_text_report(template_data, txt_path, report_type)
+                generate_text_report(template_data, txt_path, report_type, now)
                 return txt_path
             except Exception as txt_error:
                 logger.error(f"Ошибка при генерации текстового отчета: {txt_error}")
                 return None
         
-        # Генерируем также текстовый отчет как резервную копию
-        generate_text_report(template_data, txt_path, report_type)
+        # По запросу генерируем также текстовый отчет как резервную копию
+        if also_write_text:
+            generate_text_report(template_data, txt_path, report_type, now)
         
         return pdf_path
         
@@ -194,23 +261,195 @@ def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
         return None
 
 
+async def generate_pdf_async(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
+                             interpretation_data: Dict[str, Any], report_type: str = 'full',
+                             also_write_text: bool = False) -> Optional[str]:
+    """
+    Асинхронная обертка над generate_pdf: верстка выполняется в пуле потоков
+    и не блокирует цикл событий бота.
+    
+    Returns:
+        str: Путь к сгенерированному PDF-файлу или None в случае ошибки
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_PDF_POOL, generate_pdf, user_data, numerology_data,
+                                      interpretation_data, report_type, also_write_text)
+
+
+def _split_html(html_content: str) -> Tuple[str, str]:
+    """
+    Разделяет HTML-документ на часть до <body> (включительно) и содержимое body.
+    """
+    head, _, rest = html_content.partition('<body>')
+    body = rest.rpartition('</body>')[0] if '</body>' in rest else rest
+    return head + '<body>', body
+
+
+def generate_pdf_batch(jobs: List[Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], str]],
+                       also_write_text: bool = False) -> List[Optional[str]]:
+    """
+    Генерирует несколько PDF-отчетов за один запуск WeasyPrint.
+    
+    HTML всех отчетов объединяется в один документ (каждый отчет с новой страницы),
+    который верстается один раз, после чего страницы каждого отчета сохраняются
+    в отдельный PDF-файл в директории пользователя. Нумерация страниц в колонтитулах
+    сквозная для всего пакета.
+    
+    Args:
+        jobs: Список кортежей (user_data, numerology_data, interpretation_data, report_type)
+        also_write_text: Сохранять ли текстовые копии отчетов рядом с PDF
+        
+    Returns:
+        List[Optional[str]]: Пути к сгенерированным отчетам в порядке jobs
+        (None для отчетов, которые не удалось создать)
+    """
+    if not jobs:
+        return []
+    
+    template = get_jinja_template()
+    now = datetime.now()
+    timestamp = now.strftime('%Y%m%d_%H%M%S')
+    
+    prepared = []
+    html_head = None
+    html_parts = []
+    for index, (user_data, numerology_data, interpretation_data, report_type) in enumerate(jobs):
+        try:
+            user_dir = get_user_directory(user_data)
+            birthdate_formatted = format_date(user_data.get('birthdate', ''))
+            template_data = prepare_template_data(user_data, numerology_data, interpretation_data, birthdate_formatted, report_type, now)
+            
+            file_prefix = f"{report_type}_{timestamp}_{index}"
+            pdf_path = os.path.join(user_dir, f"{file_prefix}.pdf")
+            txt_path = os.path.join(user_dir, f"{file_prefix}.txt")
+            
+            head, body = _split_html(template.render(**template_data))
+            if html_head is None:
+                html_head = head
+            
+            # Якорь отмечает первую страницу отчета в общем документе
+            page_break = ' style="page-break-before: always;"' if html_parts else ''
+            html_parts.append(f'<div id="report-{index}"{page_break}>{body}</div>')
+            prepared.append((index, template_data, report_type, pdf_path, txt_path))
+        except Exception as e:
+            logger.error(f"Ошибка при подготовке отчета #{index}: {e}")
+    
+    results: List[Optional[str]] = [None] * len(jobs)
+    if not prepared:
+        return results
+    
+    try:
+        # Верстаем все отчеты одним документом
+        document = HTML(string=html_head + ''.join(html_parts) + '</body></html>').render(stylesheets=_STYLESHEETS, font_config=_FONT_CONFIG)
+        
+        # Находим первую страницу каждого отчета по якорям
+        start_pages = {}
+        for page_number, page in enumerate(document.pages):
+            for anchor in page.anchors:
+                if anchor.startswith('report-'):
+                    start_pages.setdefault(int(anchor[len('report-'):]), page_number)
+        
+        starts = [start_pages[index] for index, *_ in prepared]
+        ends = starts[1:] + [len(document.pages)]
+        
+        for (index, template_data, report_type, pdf_path, txt_path), start, end in zip(prepared, starts, ends):
+            with open(pdf_path, 'wb', buffering=PDF_BUFFER_SIZE) as pdf_file:
+                document.copy(document.pages[start:end]).write_pdf(pdf_file, optimize_images=True, jpeg_quality=80)
+            logger.info(f"PDF отчет успешно сгенерирован: {pdf_path}")
+            if also_write_text:
+                generate_text_report(template_data, txt_path, report_type, now)
+            results[index] = pdf_path
+    except Exception as pdf_error:
+        logger.error(f"Ошибка при пакетной генерации PDF: {pdf_error}")
+        logger.info("Создаем текстовые отчеты для несгенерированных PDF...")
+        for index, template_data, report_type, pdf_path, txt_path in prepared:
+            if results[index] is None:
+                results[index] = generate_text_report(template_data, txt_path, report_type, now)
+    
+    return results
+
+
+def _warm_env():
+    """
+    Инициализатор рабочего процесса: компилирует шаблон заранее, один раз на процесс.
+    """
+    get_jinja_template()
+
+
+def _generate_one(job: Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], str]) -> Optional[str]:
+    """
+    Генерирует один отчет в рабочем процессе (функция уровня модуля, чтобы ее можно было передать в пул).
+    """
+    return generate_pdf(*job)
+
+
+def generate_pdfs_parallel(jobs: List[Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], str]],
+                           max_workers: Optional[int] = None) -> List[Optional[str]]:
+    """
+    Генерирует отчеты параллельно в пуле процессов (для массовой генерации).
+    Верстка одного документа в WeasyPrint не распараллеливается, поэтому
+    каждый отчет обрабатывается в отдельном процессе.
+    
+    Args:
+        jobs: Список кортежей (user_data, numerology_data, interpretation_data, report_type)
+        max_workers: Количество процессов (по умолчанию - число ядер)
+        
+    Returns:
+        List[Optional[str]]: Пути к сгенерированным отчетам в порядке jobs
+    """
+    if not jobs:
+        return []
+    
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(), initializer=_warm_env) as executor:
+        return list(executor.map(_generate_one, jobs))
+
+
+# Поддерживаемые форматы строковых дат (самый частый - первым)
+_DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y")
+
+# Те же форматы одним выражением: ГГГГ-ММ-ДД либо ДД.ММ.ГГГГ / ДД/ММ/ГГГГ
+_DATE_RE = re.compile(r'([0-9]{4})-([0-9]{1,2})-([0-9]{1,2})|([0-9]{1,2})([./])([0-9]{1,2})\5([0-9]{4})')
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_date_str(date_str: str) -> str:
+    """
+    Приводит строковую дату к формату ДД.ММ.ГГГГ.
+    Результат кешируется: одни и те же даты повторяются между отчетами.
+    """
+    match = _DATE_RE.fullmatch(date_str)
+    if match:
+        # Разбираем дату без strptime; порядок полей определяется по разделителю
+        if match.group(1):
+            year, month, day = match.group(1, 2, 3)
+        else:
+            day, month, year = match.group(4, 6, 7)
+        try:
+            return datetime(int(year), int(month), int(day)).strftime('%d.%m.%Y')
+        except ValueError:
+            # Несуществующая дата - остальные форматы ей тоже не подойдут
+            return date_str
+    
+    try:
+        # Редкие варианты записи (например, с пробелами) разбираем через strptime
+        for fmt in _DATE_FORMATS:
+            try:
+                date_obj = datetime.strptime(date_str, fmt)
+                return date_obj.strftime('%d.%m.%Y')
+            except ValueError:
+                continue
+        # Если ни один формат не подошел, возвращаем как есть
+        return date_str
+    except Exception:
+        return date_str
+
+
 def format_date(date_value: Union[str, datetime.date]) -> str:
     """
     Форматирует дату в читаемый формат.
     """
     if isinstance(date_value, str):
-        try:
-            # Пробуем разные форматы
-            for fmt in ["%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y"]:
-                try:
-                    date_obj = datetime.strptime(date_value, fmt)
-                    return date_obj.strftime('%d.%m.%Y')
-                except ValueError:
-                    continue
-            # Если ни один формат не подошел, возвращаем как есть
-            return date_value
-        except Exception:
-            return date_value
+        return _parse_date_str(date_value)
     elif hasattr(date_value, 'strftime'):
         # Если это объект даты
         return date_value.strftime('%d.%m.%Y')
@@ -218,62 +457,63 @@ def format_date(date_value: Union[str, datetime.date]) -> str:
         return str(date_value)
 
 
+# Нумерологические числа и соответствующие им ключи шаблона
+_NUMBER_KEYS = tuple(
+    (key, f"{key.replace('soul_urge', 'soul')}_number")
+    for key in ('life_path', 'expression', 'soul_urge', 'personality', 'destiny')
+)
+
+# Тексты интерпретаций по умолчанию; строятся один раз при импорте
+_NUM_TYPES = ('life_path', 'expression', 'soul', 'personality')
+_DEFAULTS: Dict[str, str] = {
+    **{f'{num_type}_interpretation': f"Интерпретация числа {num_type.replace('_', ' ')}." for num_type in _NUM_TYPES},
+    **{f'{num_type}_detailed': f"Подробный анализ числа {num_type.replace('_', ' ')}." for num_type in _NUM_TYPES},
+    'forecast': "Прогноз на ближайшее время.",
+    'recommendations': "Рекомендации для вашего развития.",
+}
+
+
 def prepare_template_data(user_data: Dict[str, Any], numerology_data: Dict[str, Any], 
                          interpretation_data: Dict[str, Any], birthdate_formatted: str, 
-                         report_type: str) -> Dict[str, Any]:
+                         report_type: str, now: Optional[datetime] = None) -> Dict[str, Any]:
     """
     Подготавливает данные для шаблона.
+    Время составления отчета берется из now (по умолчанию - текущее).
     """
-    # Базовые данные
-    template_data = {
+    if now is None:
+        now = datetime.now()
+    
+    # Базовые данные поверх текстов по умолчанию
+    template_data = dict(_DEFAULTS)
+    template_data.update({
         'user_name': user_data.get('fio', 'Пользователь'),
         'birthdate': birthdate_formatted,
-        'current_date': datetime.now().strftime('%d.%m.%Y'),
-        'current_year': datetime.now().year,
-    }
+        'current_date': now.strftime('%d.%m.%Y'),
+        'current_year': now.year,
+    })
     
     # Добавляем нумерологические данные
-    for key in ['life_path', 'expression', 'soul_urge', 'personality', 'destiny']:
-        template_key = key.replace('soul_urge', 'soul')
-        template_data[f'{template_key}_number'] = numerology_data.get(key, '')
+    for key, template_key in _NUMBER_KEYS:
+        template_data[template_key] = numerology_data.get(key, '')
     
     # Добавляем интерпретации
     # Проверяем, является ли interpretation_data словарем
     if isinstance(interpretation_data, dict):
-        # Если у нас полноценный JSON ответ
-        intro_text = interpretation_data.get('introduction', '')
-        if not intro_text and isinstance(interpretation_data.get('full_report'), dict):
-            intro_text = interpretation_data.get('full_report', {}).get('introduction', '')
-        template_data['introduction'] = intro_text or "Персональный нумерологический анализ на основе ваших данных."
-        
-        # Добавляем интерпретации для каждого числа
-        for num_type in ['life_path', 'expression', 'soul', 'personality']:
-            interp_key = f'{num_type}_interpretation'
-            detailed_key = f'{num_type}_detailed'
-            
-            # Проверяем разные источники данных
-            interp_value = interpretation_data.get(interp_key, '')
-            if not interp_value and isinstance(interpretation_data.get('full_report'), dict):
-                interp_value = interpretation_data.get('full_report', {}).get(interp_key, '')
-            
-            detailed_value = interpretation_data.get(detailed_key, '')
-            if not detailed_value and isinstance(interpretation_data.get('full_report'), dict):
-                detailed_value = interpretation_data.get('full_report', {}).get(detailed_key, '')
-            
-            # Добавляем в данные шаблона
-            template_data[interp_key] = interp_value or f"Интерпретация числа {num_type.replace('_', ' ')}."
-            template_data[detailed_key] = detailed_value or f"Подробный анализ числа {num_type.replace('_', ' ')}."
+        # Если у нас полноценный JSON ответ: плоское представление, где
+        # непустые ключи верхнего уровня перекрывают значения из full_report
+        full_report = interpretation_data.get('full_report')
+        merged = {
+            **(full_report if isinstance(full_report, dict) else {}),
+            **{k: v for k, v in interpretation_data.items() if k != 'full_report' and v},
+        }
+        template_data['introduction'] = merged.get('introduction') or "Персональный нумерологический анализ на основе ваших данных."
         
-        # Добавляем прогноз и рекомендации
-        forecast = interpretation_data.get('forecast', '')
-        if not forecast and isinstance(interpretation_data.get('full_report'), dict):
-            forecast = interpretation_data.get('full_report', {}).get('forecast', '')
-        template_data['forecast'] = forecast or "Прогноз на ближайшее время."
-        
-        recommendations = interpretation_data.get('recommendations', '')
-        if not recommendations and isinstance(interpretation_data.get('full_report'), dict):
-            recommendations = interpretation_data.get('full_report', {}).get('recommendations', '')
-        template_data['recommendations'] = recommendations or "Рекомендации для вашего развития."
+        # Интерпретации чисел, прогноз и рекомендации: перезаписываем
+        # только непустые значения, для остальных остаются тексты по умолчанию
+        for key in _DEFAULTS:
+            value = merged.get(key)
+            if value:
+                template_data[key] = value
         
         # Для отчета о совместимости
         if report_type == 'compatibility':
@@ -299,122 +539,107 @@ def prepare_template_data(user_data: Dict[str, Any], numerology_data: Dict[str,
             template_data['compatibility_report'] = False
     else:
         # Если interpretation_data не словарь, используем его как текст
+        # (остальные поля - тексты по умолчанию)
         template_data['introduction'] = str(interpretation_data) or "Персональный нумерологический анализ."
-        
-        # Заполняем стандартные поля
-        for num_type in ['life_path', 'expression', 'soul', 'personality']:
-            template_data[f'{num_type}_interpretation'] = f"Интерпретация числа {num_type.replace('_', ' ')}."
-            template_data[f'{num_type}_detailed'] = f"Подробный анализ числа {num_type.replace('_', ' ')}."
-        
-        template_data['forecast'] = "Прогноз на ближайшее время."
-        template_data['recommendations'] = "Рекомендации для вашего развития."
     
     return template_data
 
 
-def generate_text_report(template_data: Dict[str, Any], txt_path: str, report_type: str = 'full'):
+def _section(title: str) -> Tuple[str, str]:
+    """
+    Заголовок раздела текстового отчета: название и разделитель.
+    """
+    return (title, SEP_DASH_LINE)
+
+
+def generate_text_report(template_data: Dict[str, Any], txt_path: str, report_type: str = 'full',
+                         now: Optional[datetime] = None):
     """
     Генерирует текстовый отчет на основе данных шаблона.
     """
     try:
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            # Заголовок
-            f.write(f"{'=' * 50}\n")
-            if report_type == 'compatibility':
-                f.write("ОТЧЕТ О НУМЕРОЛОГИЧЕСКОЙ СОВМЕСТИМОСТИ\n")
-            else:
-                f.write("НУМЕРОЛОГИЧЕСКИЙ ОТЧЕТ\n")
-            f.write(f"{'=' * 50}\n\n")
-            
-            # Информация о пользователе
-            f.write(f"Отчет для: {template_data.get('user_name', 'Пользователь')}\n")
-            f.write(f"Дата рождения: {template_data.get('birthdate', '')}\n")
-            f.write(f"Дата составления: {template_data.get('current_date', '')}\n\n")
-            
-            # Введение
-            f.write("ВВЕДЕНИЕ\n")
-            f.write(f"{'-' * 40}\n")
-            f.write(f"{template_data.get('introduction', '')}\n\n")
-            
-            # Ключевые числа
-            f.write("КЛЮЧЕВЫЕ ЧИСЛА ВАШЕЙ СУДЬБЫ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            # Число жизненного пути
-            lp = template_data.get('life_path_number', '')
-            f.write(f"Число жизненного пути: {lp}\n")
-            f.write(f"{template_data.get('life_path_interpretation', '')}\n\n")
-            
-            # Число выражения
-            exp = template_data.get('expression_number', '')
-            f.write(f"Число выражения: {exp}\n")
-            f.write(f"{template_data.get('expression_interpretation', '')}\n\n")
-            
-            # Число души
-            soul = template_data.get('soul_number', '')
-            f.write(f"Число души: {soul}\n")
-            f.write(f"{template_data.get('soul_interpretation', '')}\n\n")
-            
-            # Число личности
-            pers = template_data.get('personality_number', '')
-            f.write(f"Число личности: {pers}\n")
-            f.write(f"{template_data.get('personality_interpretation', '')}\n\n")
-            
-            # Подробный анализ
-            f.write("ПОДРОБНЫЙ АНАЛИЗ ЧИСЕЛ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            f.write(f"Число жизненного пути: {lp}\n")
-            f.write(f"{template_data.get('life_path_detailed', '')}\n\n")
-            
-            f.write(f"Число выражения: {exp}\n")
-            f.write(f"{template_data.get('expression_detailed', '')}\n\n")
-            
-            f.write(f"Число души: {soul}\n")
-            f.write(f"{template_data.get('soul_detailed', '')}\n\n")
-            
-            f.write(f"Число личности: {pers}\n")
-            f.write(f"{template_data.get('personality_detailed', '')}\n\n")
-            
-            # Дополнительная информация для отчета о совместимости
-            if template_data.get('compatibility_report', False):
-                f.write("АНАЛИЗ СОВМЕСТИМОСТИ\n")
-                f.write(f"{'-' * 40}\n")
-                
-                if 'partner_name' in template_data:
-                    f.write(f"Партнер: {template_data.get('partner_name', '')}\n")
-                if 'partner_birthdate' in template_data:
-                    f.write(f"Дата рождения партнера: {template_data.get('partner_birthdate', '')}\n\n")
-                
-                f.write(f"{template_data.get('compatibility_intro', '')}\n\n")
-                
-                score = template_data.get('compatibility_score', 0)
-                f.write(f"Общая совместимость: {score}%\n\n")
-                
-                f.write("Сильные стороны отношений:\n")
-                f.write(f"{template_data.get('compatibility_strengths', '')}\n\n")
-                
-                f.write("Возможные трудности:\n")
-                f.write(f"{template_data.get('compatibility_challenges', '')}\n\n")
-                
-                f.write("Рекомендации:\n")
-                f.write(f"{template_data.get('compatibility_recommendations', '')}\n\n")
-            
-            # Прогноз и рекомендации
-            f.write("ПРОГНОЗ И РЕКОМЕНДАЦИИ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            f.write(f"{template_data.get('forecast', '')}\n\n")
+        # Отчет собирается в список строк и записывается в файл одним вызовом
+        parts = []
+        
+        # Заголовок
+        if report_type == 'compatibility':
+            parts.extend((SEP_EQ_LINE, "ОТЧЕТ О НУМЕРОЛОГИЧЕСКОЙ СОВМЕСТИМОСТИ", SEP_EQ_LINE, ""))
+        else:
+            parts.extend((SEP_EQ_LINE, "НУМЕРОЛОГИЧЕСКИЙ ОТЧЕТ", SEP_EQ_LINE, ""))
+        
+        # Информация о пользователе
+        parts.extend((
+            f"Отчет для: {template_data.get('user_name', 'Пользователь')}",
+            f"Дата рождения: {template_data.get('birthdate', '')}",
+            f"Дата составления: {template_data.get('current_date', '')}",
+            "",
+        ))
+        
+        # Введение
+        parts.extend(_section("ВВЕДЕНИЕ"))
+        parts.extend((str(template_data.get('introduction', '')), ""))
+        
+        lp = template_data.get('life_path_number', '')
+        exp = template_data.get('expression_number', '')
+        soul = template_data.get('soul_number', '')
+        pers = template_data.get('personality_number', '')
+        
+        # Ключевые числа
+        parts.extend(_section("КЛЮЧЕВЫЕ ЧИСЛА ВАШЕЙ СУДЬБЫ"))
+        parts.extend((
+            f"Число жизненного пути: {lp}", str(template_data.get('life_path_interpretation', '')), "",
+            f"Число выражения: {exp}", str(template_data.get('expression_interpretation', '')), "",
+            f"Число души: {soul}", str(template_data.get('soul_interpretation', '')), "",
+            f"Число личности: {pers}", str(template_data.get('personality_interpretation', '')), "",
+        ))
+        
+        # Подробный анализ
+        parts.extend(_section("ПОДРОБНЫЙ АНАЛИЗ ЧИСЕЛ"))
+        parts.extend((
+            f"Число жизненного пути: {lp}", str(template_data.get('life_path_detailed', '')), "",
+            f"Число выражения: {exp}", str(template_data.get('expression_detailed', '')), "",
+            f"Число души: {soul}", str(template_data.get('soul_detailed', '')), "",
+            f"Число личности: {pers}", str(template_data.get('personality_detailed', '')), "",
+        ))
+        
+        # Дополнительная информация для отчета о совместимости
+        if template_data.get('compatibility_report', False):
+            parts.extend(_section("АНАЛИЗ СОВМЕСТИМОСТИ"))
             
-            f.write("Личные рекомендации:\n")
-            f.write(f"{template_data.get('recommendations', '')}\n\n")
+            if 'partner_name' in template_data:
+                parts.append(f"Партнер: {template_data.get('partner_name', '')}")
+            if 'partner_birthdate' in template_data:
+                parts.extend((f"Дата рождения партнера: {template_data.get('partner_birthdate', '')}", ""))
             
-            # Футер
-            f.write(f"{'=' * 50}\n")
-            current_year = template_data.get('current_year', datetime.now().year)
-            f.write(f"© ИИ-Нумеролог {current_year}. Все права защищены.\n")
-            f.write("Данный отчет сгенерирован с использованием искусственного интеллекта.\n")
-            f.write("Для получения обновлений и еженедельных прогнозов подпишитесь в Telegram-боте.\n")
+            parts.extend((
+                str(template_data.get('compatibility_intro', '')), "",
+                f"Общая совместимость: {template_data.get('compatibility_score', 0)}%", "",
+                "Сильные стороны отношений:", str(template_data.get('compatibility_strengths', '')), "",
+                "Возможные трудности:", str(template_data.get('compatibility_challenges', '')), "",
+                "Рекомендации:", str(template_data.get('compatibility_recommendations', '')), "",
+            ))
+        
+        # Прогноз и рекомендации
+        parts.extend(_section("ПРОГНОЗ И РЕКОМЕНДАЦИИ"))
+        parts.extend((
+            str(template_data.get('forecast', '')), "",
+            "Личные рекомендации:", str(template_data.get('recommendations', '')), "",
+        ))
+        
+        # Футер
+        current_year = template_data.get('current_year')
+        if current_year is None:
+            current_year = (now or datetime.now()).year
+        parts.extend((
+            SEP_EQ_LINE,
+            f"© ИИ-Нумеролог {current_year}. Все права защищены.",
+            "Данный отчет сгенерирован с использованием искусственного интеллекта.",
+            "Для получения обновлений и еженедельных прогнозов подпишитесь в Telegram-боте.",
+            "",
+        ))
+        
+        with open(txt_path, 'w', encoding='utf-8', buffering=TEXT_BUFFER_SIZE) as f:
+            f.write("\n".join(parts))
         
         logger.info(f"Текстовый отчет успешно сгенерирован: {txt_path}")
         return txt_path
@@ -5,13 +5,19 @@
 """
 
 import os
+import functools
+import json
 import logging
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from pathlib import Path
+from types import MappingProxyType
 import re
 from typing import Dict, Any, Optional, Union
 import jinja2
 from weasyprint import HTML, CSS
+from weasyprint.text.fonts import FontConfiguration
 
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -19,20 +25,65 @@ logger = logging.getLogger(__name__)
 
 # Путь к HTML-шаблону и директории для сохранения отчетов
 TEMPLATE_FILE = 'pdf_template.html'
+STYLE_FILE = 'report.css'
 PDF_STORAGE_PATH = os.environ.get('PDF_STORAGE_PATH', './pdfs')
+# Сохранять ли промежуточный HTML рядом с отчетом (для отладки верстки)
+DEBUG_SAVE_HTML = os.environ.get('DEBUG_SAVE_HTML', 'false').lower() == 'true'
+JINJA_CACHE_PATH = os.path.join(PDF_STORAGE_PATH, '.jinja_cache')
 
 # Создаем директорию для хранения отчетов, если она не существует
 os.makedirs(PDF_STORAGE_PATH, exist_ok=True)
+os.makedirs(JINJA_CACHE_PATH, exist_ok=True)
+
+# Стили базового шаблона (используется, если TEMPLATE_FILE не найден)
+CSS_TEXT = """
+body { font-family: Arial, sans-serif; margin: 40px; }
+h1 { color: #4b0082; text-align: center; }
+h2 { color: #4b0082; border-bottom: 1px solid #ddd; }
+.number { font-size: 24px; font-weight: bold; color: #4b0082; }
+.section { margin: 20px 0; }
+footer { margin-top: 50px; text-align: center; font-size: 12px; color: #666; }
+"""
+
+# Конфигурация шрифтов и таблицы стилей WeasyPrint создаются один раз на процесс
+_FONT_CONFIG = FontConfiguration()
+_BASIC_STYLESHEETS = [CSS(string=CSS_TEXT, font_config=_FONT_CONFIG)]
+
+# Стили основного шаблона вынесены в отдельный файл
+try:
+    _STYLESHEETS = [CSS(filename=STYLE_FILE, font_config=_FONT_CONFIG)]
+except Exception as e:
+    logger.error(f"Не удалось загрузить стили {STYLE_FILE}: {e}")
+    _STYLESHEETS = None
+
+# Пул потоков для записи вспомогательных файлов параллельно с версткой PDF
+_IO_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='report-io')
+
+# Окружение Jinja2 создается один раз на процесс; файл шаблона не проверяется
+# на изменения при каждом рендере, а байткод сохраняется на диск между перезапусками.
+# Данные в HTML экранируются, отступы вокруг тегов удаляются при компиляции
+_ENV = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(searchpath="./"),
+    autoescape=jinja2.select_autoescape(['html']),
+    trim_blocks=True,
+    lstrip_blocks=True,
+    auto_reload=False,
+    cache_size=64,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(directory=JINJA_CACHE_PATH, pattern="__jinja2_%s.cache")
+)
+
+# Недопустимые в имени файла символы и пробельные символы
+_SANITIZE_RE = re.compile(r'[\\/*?:"<>|\s]')
 
 def sanitize_filename(filename: str) -> str:
     """
     Очищает имя файла от недопустимых символов
     """
-    # Заменяем недопустимые символы на нижнее подчеркивание
-    sanitized = re.sub(r'[\\/*?:"<>|]', '_', filename)
-    # Заменяем пробелы на нижнее подчеркивание
-    sanitized = sanitized.replace(' ', '_')
-    return sanitized
+    # Заменяем недопустимые и пробельные символы на нижнее подчеркивание за один проход
+    return _SANITIZE_RE.sub('_', filename)
+
+# Созданные директории пользователей: имя пользователя -> путь
+_USER_DIR_CACHE: Dict[str, str] = {}
 
 def get_user_directory(user_data: Dict[str, Any]) -> str:
     """
@@ -40,19 +91,114 @@ def get_user_directory(user_data: Dict[str, Any]) -> str:
     """
     # Получаем ФИО пользователя или используем ID, если ФИО отсутствует
     user_name = user_data.get('fio', f"user_{user_data.get('id', 'unknown')}")
-    sanitized_name = sanitize_filename(user_name)
+    
+    # Директория уже создана этим процессом
+    user_dir = _USER_DIR_CACHE.get(user_name)
+    if user_dir is not None:
+        return user_dir
     
     # Создаем путь к директории пользователя
+    sanitized_name = sanitize_filename(user_name)
     user_dir = os.path.join(PDF_STORAGE_PATH, sanitized_name)
     
     # Создаем директорию, если она не существует
     os.makedirs(user_dir, exist_ok=True)
+    _USER_DIR_CACHE[user_name] = user_dir
     
     return user_dir
 
+# Шаблон текстового отчета; компилируется один раз через общее окружение
+# (с отключенным экранированием HTML и удалением переводов строк после тегов)
+_TEXT_TEMPLATE = _ENV.overlay(
+    autoescape=False,
+    trim_blocks=True,
+    lstrip_blocks=True,
+    keep_trailing_newline=True
+).from_string("""\
+==================================================
+{% if report_type == 'compatibility' %}
+ОТЧЕТ О НУМЕРОЛОГИЧЕСКОЙ СОВМЕСТИМОСТИ
+{% else %}
+НУМЕРОЛОГИЧЕСКИЙ ОТЧЕТ
+{% endif %}
+==================================================
+
+Отчет для: {{ user_name | default('Пользователь') }}
+Дата рождения: {{ birthdate | default('') }}
+Дата составления: {{ current_date | default('') }}
+
+ВВЕДЕНИЕ
+----------------------------------------
+{{ introduction | default('') }}
+
+КЛЮЧЕВЫЕ ЧИСЛА ВАШЕЙ СУДЬБЫ
+----------------------------------------
+Число жизненного пути: {{ life_path_number | default('') }}
+{{ life_path_interpretation | default('') }}
+
+Число выражения: {{ expression_number | default('') }}
+{{ expression_interpretation | default('') }}
+
+Число души: {{ soul_number | default('') }}
+{{ soul_interpretation | default('') }}
+
+Число личности: {{ personality_number | default('') }}
+{{ personality_interpretation | default('') }}
+
+ПОДРОБНЫЙ АНАЛИЗ ЧИСЕЛ
+----------------------------------------
+Число жизненного пути: {{ life_path_number | default('') }}
+{{ life_path_detailed | default('') }}
+
+Число выражения: {{ expression_number | default('') }}
+{{ expression_detailed | default('') }}
+
+Число души: {{ soul_number | default('') }}
+{{ soul_detailed | default('') }}
+
+Число личности: {{ personality_number | default('') }}
+{{ personality_detailed | default('') }}
+
+{% if report_type == 'compatibility' or compatibility_report | default(false) %}
+АНАЛИЗ СОВМЕСТИМОСТИ
+----------------------------------------
+{% if partner_name is defined %}
+Партнер: {{ partner_name }}
+{% endif %}
+{% if partner_birthdate is defined %}
+Дата рождения партнера: {{ partner_birthdate }}
+
+{% endif %}
+{{ compatibility_intro | default('') }}
+
+Общая совместимость: {{ compatibility_score | default(0) }}%
+
+Сильные стороны отношений:
+{{ compatibility_strengths | default('') }}
+
+Возможные трудности:
+{{ compatibility_challenges | default('') }}
+
+Рекомендации:
+{{ compatibility_recommendations | default('') }}
+
+{% endif %}
+ПРОГНОЗ И РЕКОМЕНДАЦИИ
+----------------------------------------
+{{ forecast | default('') }}
+
+Личные рекомендации:
+{{ recommendations | default('') }}
+
+==================================================
+© ИИ-Нумеролог {{ current_year | default(default_year) }}. Все права защищены.
+Данный отчет сгенерирован с использованием искусственного интеллекта.
+Для получения обновлений и еженедельных прогнозов подпишитесь в Telegram-боте.
+""")
+
 def create_basic_html_template() -> str:
     """
-    Создает базовый HTML-шаблон для отчета
+    Создает базовый HTML-шаблон для отчета (стили - в CSS_TEXT)
     """
     return """
     <!DOCTYPE html>
@@ -60,14 +206,6 @@ def create_basic_html_template() -> str:
     <head>
         <meta charset="UTF-8">
         <title>Нумерологический отчет</title>
-        <style>
-            body { font-family: Arial, sans-serif; margin: 40px; }
-            h1 { color: #4b0082; text-align: center; }
-            h2 { color: #4b0082; border-bottom: 1px solid #ddd; }
-            .number { font-size: 24px; font-weight: bold; color: #4b0082; }
-            .section { margin: 20px 0; }
-            footer { margin-top: 50px; text-align: center; font-size: 12px; color: #666; }
-        </style>
     </head>
     <body>
         <h1>Нумерологический отчет для {{ user_name }}</h1>
@@ -110,32 +248,23 @@ def create_basic_html_template() -> str:
     </html>
     """
 
+@functools.lru_cache(maxsize=1)
 def get_jinja_template():
     """
-    Получает объект шаблона Jinja2 для генерации HTML
+    Получает объект шаблона Jinja2 для генерации HTML.
+    Шаблон компилируется один раз на процесс, последующие вызовы возвращают его из кеша
     """
     try:
-        # Попытка загрузить шаблон из файла
-        template_loader = jinja2.FileSystemLoader(searchpath="./")
-        template_env = jinja2.Environment(loader=template_loader)
-        
         # Проверяем существование файла шаблона
         if os.path.exists(TEMPLATE_FILE):
-            template = template_env.get_template(TEMPLATE_FILE)
+            template = _ENV.get_template(TEMPLATE_FILE)
             logger.info(f"Шаблон {TEMPLATE_FILE} успешно загружен")
             return template
         else:
             logger.warning(f"Шаблон {TEMPLATE_FILE} не найден, используем базовый шаблон")
             
-            # Создаем временный файл с базовым шаблоном
-            basic_template = create_basic_html_template()
-            temp_template_file = "temp_template.html"
-            
-            with open(temp_template_file, "w", encoding="utf-8") as f:
-                f.write(basic_template)
-                
-            template = template_env.get_template(temp_template_file)
-            return template
+            # Компилируем базовый шаблон в памяти, без временного файла
+            return _ENV.from_string(create_basic_html_template())
     except Exception as e:
         logger.error(f"Ошибка при загрузке шаблона: {e}")
         
@@ -143,108 +272,139 @@ def get_jinja_template():
         basic_template = create_basic_html_template()
         return jinja2.Template(basic_template)
 
+# Формат строковой даты определяется по разделителю: каждый из них
+# встречается только в одном из поддерживаемых форматов
+_DATE_FORMAT_BY_SEP = (('-', "%Y-%m-%d"), ('.', "%d.%m.%Y"), ('/', "%d/%m/%Y"))
+
+@functools.lru_cache(maxsize=512)
+def _parse_date_str(date_str: str) -> str:
+    """
+    Приводит строковую дату к формату ДД.ММ.ГГГГ (результат кешируется)
+    """
+    for sep, fmt in _DATE_FORMAT_BY_SEP:
+        if sep in date_str:
+            try:
+                return datetime.strptime(date_str, fmt).strftime('%d.%m.%Y')
+            except ValueError:
+                return date_str
+    # Если ни один формат не подошел, возвращаем как есть
+    return date_str
+
 def format_date(date_value: Union[str, datetime.date]) -> str:
     """
     Форматирует дату в читаемый формат
     """
     if isinstance(date_value, str):
-        try:
-            # Пробуем разные форматы даты
-            for fmt in ["%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y"]:
-                try:
-                    date_obj = datetime.strptime(date_value, fmt)
-                    return date_obj.strftime('%d.%m.%Y')
-                except ValueError:
-                    continue
-            # Если ни один формат не подошел, возвращаем как есть
-            return date_value
-        except Exception:
-            return date_value
+        return _parse_date_str(date_value)
     elif hasattr(date_value, 'strftime'):
         # Если это объект даты
         return date_value.strftime('%d.%m.%Y')
     else:
         return str(date_value)
 
+# Нумерологические числа, попадающие в шаблон, и соответствующие им ключи шаблона
+_NUMERO_KEYS = frozenset({'life_path', 'expression', 'soul_urge', 'personality', 'destiny'})
+_NUMERO_KEY_MAP = MappingProxyType({
+    key: f"{key.replace('soul_urge', 'soul')}_number" for key in sorted(_NUMERO_KEYS)
+})
+
+# Значения по умолчанию для недостающих полей шаблона (только для чтения)
+_DEFAULT_FIELDS = MappingProxyType({
+    'introduction': 'Ваш персональный нумерологический анализ.',
+    'life_path_interpretation': 'Интерпретация числа жизненного пути.',
+    'expression_interpretation': 'Интерпретация числа выражения.',
+    'soul_interpretation': 'Интерпретация числа души.',
+    'personality_interpretation': 'Интерпретация числа личности.',
+    'life_path_detailed': 'Подробный анализ числа жизненного пути.',
+    'expression_detailed': 'Подробный анализ числа выражения.',
+    'soul_detailed': 'Подробный анализ числа души.',
+    'personality_detailed': 'Подробный анализ числа личности.',
+    'forecast': 'Прогноз на ближайшее время.',
+    'recommendations': 'Рекомендации для вашего развития.'
+})
+
 def prepare_template_data(user_data: Dict[str, Any], numerology_data: Dict[str, Any], 
-                         interpretation_data: Dict[str, Any], report_type: str) -> Dict[str, Any]:
+                         interpretation_data: Dict[str, Any], report_type: str,
+                         now: Optional[datetime] = None) -> Dict[str, Any]:
     """
     Подготавливает данные для шаблона
+    Время составления отчета берется из now (по умолчанию - текущее)
     """
+    if now is None:
+        now = datetime.now()
+    
     # Форматируем дату рождения
     birthdate_formatted = format_date(user_data.get('birthdate', ''))
     
     # Базовые данные
-    template_data = {
+    base = {
         'user_name': user_data.get('fio', 'Пользователь'),
         'birthdate': birthdate_formatted,
-        'current_date': datetime.now().strftime('%d.%m.%Y'),
-        'current_year': datetime.now().year,
+        'current_date': now.strftime('%d.%m.%Y'),
+        'current_year': now.year,
+    }
+    
+    # Нумерологические данные
+    numero = {
+        template_key: numerology_data[key]
+        for key, template_key in _NUMERO_KEY_MAP.items() if key in numerology_data
     }
     
-    # Добавляем нумерологические данные
-    for key in ['life_path', 'expression', 'soul_urge', 'personality', 'destiny']:
-        if key in numerology_data:
-            template_key = key.replace('soul_urge', 'soul')
-            template_data[f'{template_key}_number'] = numerology_data.get(key, '')
+    # Если interpretation_data не словарь, используем его как текст введения,
+    # остальные поля - значения по умолчанию
+    if not isinstance(interpretation_data, dict):
+        return {
+            **_DEFAULT_FIELDS,
+            **base,
+            **numero,
+            'introduction': str(interpretation_data) or _DEFAULT_FIELDS['introduction'],
+        }
     
     # Добавляем интерпретации
-    # Проверяем формат interpretation_data
-    if isinstance(interpretation_data, dict):
-        # Если у нас есть полноценный JSON-ответ
-        
-        # Обрабатываем full_report
-        full_report = interpretation_data.get('full_report', {})
-        if isinstance(full_report, dict):
-            # Копируем все поля из full_report в template_data
-            for key, value in full_report.items():
-                template_data[key] = value
-        
-        # Если есть мини-отчет, добавляем его содержимое в introduction
-        if 'mini_report' in interpretation_data:
-            template_data['introduction'] = interpretation_data['mini_report']
-        
-        # Для совместимости
-        if report_type == 'compatibility':
-            compatibility_report = interpretation_data.get('compatibility_report', {})
-            if isinstance(compatibility_report, dict):
-                template_data['compatibility_report'] = True
-                for key, value in compatibility_report.items():
-                    template_data[f'compatibility_{key}'] = value
-            
-            # Добавляем информацию о партнере, если есть
-            if 'person2' in numerology_data:
-                person2 = numerology_data.get('person2', {})
-                template_data['partner_name'] = person2.get('fio', 'Партнер')
-                birth_data = person2.get('birth_data', {})
-                partner_birthdate = birth_data.get('date', '') if isinstance(birth_data, dict) else ''
-                template_data['partner_birthdate'] = format_date(partner_birthdate)
-    else:
-        # Если interpretation_data не словарь, преобразуем в строку
-        interpretation_text = str(interpretation_data)
-        template_data['introduction'] = interpretation_text
+    # Если у нас есть полноценный JSON-ответ: поля full_report
+    # накладываются поверх базовых и нумерологических данных
+    full_report = interpretation_data.get('full_report', {})
+    template_data = {**base, **numero, **(full_report if isinstance(full_report, dict) else {})}
     
-    # Заполнение недостающих полей значениями по умолчанию
-    default_fields = {
-        'introduction': 'Ваш персональный нумерологический анализ.',
-        'life_path_interpretation': 'Интерпретация числа жизненного пути.',
-        'expression_interpretation': 'Интерпретация числа выражения.',
-        'soul_interpretation': 'Интерпретация числа души.',
-        'personality_interpretation': 'Интерпретация числа личности.',
-        'life_path_detailed': 'Подробный анализ числа жизненного пути.',
-        'expression_detailed': 'Подробный анализ числа выражения.',
-        'soul_detailed': 'Подробный анализ числа души.',
-        'personality_detailed': 'Подробный анализ числа личности.',
-        'forecast': 'Прогноз на ближайшее время.',
-        'recommendations': 'Рекомендации для вашего развития.'
-    }
+    # Если есть мини-отчет, добавляем его содержимое в introduction
+    if 'mini_report' in interpretation_data:
+        template_data['introduction'] = interpretation_data['mini_report']
+    
+    # Для совместимости
+    if report_type == 'compatibility':
+        compatibility_report = interpretation_data.get('compatibility_report', {})
+        if isinstance(compatibility_report, dict):
+            template_data['compatibility_report'] = True
+            template_data.update({f'compatibility_{key}': value for key, value in compatibility_report.items()})
+        
+        # Добавляем информацию о партнере, если есть
+        if 'person2' in numerology_data:
+            person2 = numerology_data.get('person2', {})
+            template_data['partner_name'] = person2.get('fio', 'Партнер')
+            birth_data = person2.get('birth_data', {})
+            partner_birthdate = birth_data.get('date', '') if isinstance(birth_data, dict) else ''
+            template_data['partner_birthdate'] = format_date(partner_birthdate)
     
-    for field, default_value in default_fields.items():
-        if field not in template_data or not template_data[field]:
-            template_data[field] = default_value
+    # Заполнение недостающих и пустых полей значениями по умолчанию
+    template_data.update({
+        field: default_value
+        for field, default_value in _DEFAULT_FIELDS.items()
+        if not template_data.get(field)
+    })
     
     return template_data
 
+def _save_html(html_path: str, html_content: str) -> None:
+    """
+    Сохраняет HTML отчета в файл (для отладки верстки)
+    """
+    try:
+        with open(html_path, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        logger.info(f"HTML отчет сохранен: {html_path}")
+    except OSError as e:
+        logger.error(f"Не удалось сохранить HTML отчет: {e}")
+
 def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any], 
                 interpretation_data: Dict[str, Any], report_type: str = 'full') -> Optional[str]:
     """
@@ -265,45 +425,53 @@ def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
         user_dir = get_user_directory(user_data)
         
         # Подготавливаем данные для шаблона
-        template_data = prepare_template_data(user_data, numerology_data, interpretation_data, report_type)
+        now = datetime.now()
+        template_data = prepare_template_data(user_data, numerology_data, interpretation_data, report_type, now)
         
         # Получаем шаблон
         template = get_jinja_template()
         
         # Формируем имя файла
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        timestamp = now.strftime('%Y%m%d_%H%M%S')
         user_id = user_data.get('id', '1')
         file_prefix = f"{user_id}_{report_type}"
         
-        # Пути к файлам
-        pdf_path = os.path.join(user_dir, f"{file_prefix}_{timestamp}.pdf")
-        html_path = os.path.join(user_dir, f"{file_prefix}_{timestamp}.html")
-        txt_path = os.path.join(user_dir, f"{file_prefix}_{timestamp}.txt")
+        # Пути к файлам: общая основа, различается только расширение
+        base_path = os.path.join(user_dir, f"{file_prefix}_{timestamp}")
+        pdf_path = base_path + ".pdf"
+        html_path = base_path + ".html"
+        txt_path = base_path + ".txt"
         
         # Генерируем HTML
         html_content = template.render(**template_data)
         
-        # Сохраняем HTML во временный файл
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-            logger.info(f"HTML отчет сохранен: {html_path}")
+        # Сохраняем HTML во временный файл (только для отладки) параллельно с версткой PDF
+        html_future = _IO_POOL.submit(_save_html, html_path, html_content) if DEBUG_SAVE_HTML else None
+        
+        # Базовый шаблон верстается со своими стилями
+        stylesheets = _STYLESHEETS if template.name == TEMPLATE_FILE else _BASIC_STYLESHEETS
         
         try:
-            # Генерируем PDF
-            HTML(string=html_content).write_pdf(pdf_path)
+            # Генерируем PDF в память и записываем файл одним вызовом
+            pdf_bytes = HTML(string=html_content).write_pdf(stylesheets=stylesheets, font_config=_FONT_CONFIG)
+            Path(pdf_path).write_bytes(pdf_bytes)
             logger.info(f"PDF отчет успешно сгенерирован: {pdf_path}")
             
-            # Также создаем текстовый отчет как резервную копию
-            generate_text_report(template_data, txt_path, report_type)
-            
-            return pdf_path
+            result_path = pdf_path
         except Exception as pdf_error:
             logger.error(f"Ошибка при генерации PDF: {pdf_error}")
             logger.warning("Создание текстового отчета вместо PDF")
             
+            # Сохраняем HTML для диагностики ошибки верстки
+            if html_future is None:
+                _save_html(html_path, html_content)
+            
             # Создаем текстовый отчет вместо PDF
-            txt_path = generate_text_report(template_data, txt_path, report_type)
-            return txt_path
+            result_path = generate_text_report(template_data, txt_path, report_type)
+        
+        if html_future is not None:
+            html_future.result()
+        return result_path
             
     except Exception as e:
         logger.error(f"Общая ошибка при генерации отчета: {e}")
@@ -311,31 +479,24 @@ def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
         # Аварийное создание простого текстового отчета
         try:
             emergency_path = os.path.join(PDF_STORAGE_PATH, f"emergency_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
-            with open(emergency_path, 'w', encoding='utf-8') as f:
-                f.write(f"Нумерологический отчет\n")
-                f.write(f"====================\n\n")
-                f.write(f"Имя: {user_data.get('fio', 'Пользователь')}\n")
-                f.write(f"Дата: {datetime.now().strftime('%d.%m.%Y')}\n\n")
-                
-                # Записываем доступные данные
-                if isinstance(interpretation_data, dict):
-                    for key, value in interpretation_data.items():
-                        if isinstance(value, str):
-                            f.write(f"{key}: {value}\n\n")
-                        elif isinstance(value, dict):
-                            f.write(f"{key}:\n")
-                            for k, v in value.items():
-                                if isinstance(v, str):
-                                    f.write(f"  {k}: {v}\n")
-                            f.write("\n")
-                else:
-                    f.write(f"Интерпретация: {interpretation_data}\n\n")
-                
-                f.write(f"\nПримечание: Этот аварийный отчет создан из-за ошибки при генерации полного отчета.\n")
+            # Записываем доступные данные как есть, в виде JSON
+            text = "\n".join((
+                "Нумерологический отчет",
+                "====================",
+                "",
+                f"Имя: {user_data.get('fio', 'Пользователь')}",
+                f"Дата: {datetime.now().strftime('%d.%m.%Y')}",
+                "",
+                json.dumps(interpretation_data, ensure_ascii=False, indent=2, default=str),
+                "",
+                "Примечание: Этот аварийный отчет создан из-за ошибки при генерации полного отчета.",
+                "",
+            ))
+            Path(emergency_path).write_text(text, encoding='utf-8')
             
             logger.info(f"Создан аварийный отчет: {emergency_path}")
             return emergency_path
-        except Exception as emergency_error:
+        except (OSError, ValueError) as emergency_error:
             logger.error(f"Не удалось создать аварийный отчет: {emergency_error}")
             return None
 
@@ -353,104 +514,8 @@ def generate_text_report(template_data: Dict[str, Any], output_path: str, report
         str: Путь к сгенерированному текстовому отчету
     """
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            # Заголовок
-            f.write("==================================================\n")
-            if report_type == 'compatibility':
-                f.write("ОТЧЕТ О НУМЕРОЛОГИЧЕСКОЙ СОВМЕСТИМОСТИ\n")
-            else:
-                f.write("НУМЕРОЛОГИЧЕСКИЙ ОТЧЕТ\n")
-            f.write("==================================================\n\n")
-            
-            # Информация о пользователе
-            f.write(f"Отчет для: {template_data.get('user_name', 'Пользователь')}\n")
-            f.write(f"Дата рождения: {template_data.get('birthdate', '')}\n")
-            f.write(f"Дата составления: {template_data.get('current_date', '')}\n\n")
-            
-            # Введение
-            f.write("ВВЕДЕНИЕ\n")
-            f.write(f"{'-' * 40}\n")
-            f.write(f"{template_data.get('introduction', '')}\n\n")
-            
-            # Ключевые числа
-            f.write("КЛЮЧЕВЫЕ ЧИСЛА ВАШЕЙ СУДЬБЫ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            # Число жизненного пути
-            lp = template_data.get('life_path_number', '')
-            f.write(f"Число жизненного пути: {lp}\n")
-            f.write(f"{template_data.get('life_path_interpretation', '')}\n\n")
-            
-            # Число выражения
-            exp = template_data.get('expression_number', '')
-            f.write(f"Число выражения: {exp}\n")
-            f.write(f"{template_data.get('expression_interpretation', '')}\n\n")
-            
-            # Число души
-            soul = template_data.get('soul_number', '')
-            f.write(f"Число души: {soul}\n")
-            f.write(f"{template_data.get('soul_interpretation', '')}\n\n")
-            
-            # Число личности
-            pers = template_data.get('personality_number', '')
-            f.write(f"Число личности: {pers}\n")
-            f.write(f"{template_data.get('personality_interpretation', '')}\n\n")
-            
-            # Подробный анализ
-            f.write("ПОДРОБНЫЙ АНАЛИЗ ЧИСЕЛ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            f.write(f"Число жизненного пути: {lp}\n")
-            f.write(f"{template_data.get('life_path_detailed', '')}\n\n")
-            
-            f.write(f"Число выражения: {exp}\n")
-            f.write(f"{template_data.get('expression_detailed', '')}\n\n")
-            
-            f.write(f"Число души: {soul}\n")
-            f.write(f"{template_data.get('soul_detailed', '')}\n\n")
-            
-            f.write(f"Число личности: {pers}\n")
-            f.write(f"{template_data.get('personality_detailed', '')}\n\n")
-            
-            # Дополнительная информация для отчета о совместимости
-            if report_type == 'compatibility' or template_data.get('compatibility_report', False):
-                f.write("АНАЛИЗ СОВМЕСТИМОСТИ\n")
-                f.write(f"{'-' * 40}\n")
-                
-                if 'partner_name' in template_data:
-                    f.write(f"Партнер: {template_data.get('partner_name', '')}\n")
-                if 'partner_birthdate' in template_data:
-                    f.write(f"Дата рождения партнера: {template_data.get('partner_birthdate', '')}\n\n")
-                
-                f.write(f"{template_data.get('compatibility_intro', '')}\n\n")
-                
-                score = template_data.get('compatibility_score', 0)
-                f.write(f"Общая совместимость: {score}%\n\n")
-                
-                f.write("Сильные стороны отношений:\n")
-                f.write(f"{template_data.get('compatibility_strengths', '')}\n\n")
-                
-                f.write("Возможные трудности:\n")
-                f.write(f"{template_data.get('compatibility_challenges', '')}\n\n")
-                
-                f.write("Рекомендации:\n")
-                f.write(f"{template_data.get('compatibility_recommendations', '')}\n\n")
-            
-            # Прогноз и рекомендации
-            f.write("ПРОГНОЗ И РЕКОМЕНДАЦИИ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            f.write(f"{template_data.get('forecast', '')}\n\n")
-            
-            f.write("Личные рекомендации:\n")
-            f.write(f"{template_data.get('recommendations', '')}\n\n")
-            
-            # Футер
-            f.write(f"{'=' * 50}\n")
-            current_year = template_data.get('current_year', datetime.now().year)
-            f.write(f"© ИИ-Нумеролог {current_year}. Все права защищены.\n")
-            f.write("Данный отчет сгенерирован с использованием искусственного интеллекта.\n")
-            f.write("Для получения обновлений и еженедельных прогнозов подпишитесь в Telegram-боте.\n")
+        text = _TEXT_TEMPLATE.render(template_data, report_type=report_type, default_year=datetime.now().year)
+        Path(output_path).write_text(text, encoding='utf-8')
         
         logger.info(f"Текстовый отчет успешно сгенерирован: {output_path}")
         return output_path
@@ -466,5 +531,5 @@ def generate_text_report(template_data: Dict[str, Any], output_path: str, report
                 f.write(f"Дата: {datetime.now().strftime('%d.%m.%Y')}\n\n")
                 f.write("Текст отчета не удалось отформатировать.\n")
             return simple_path
-        except:
+        except OSError:
             return None
\ No newline at end of file
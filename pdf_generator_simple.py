@@ -2,15 +2,19 @@
 Простой генератор PDF-отчетов с использованием reportlab.
 """
 
+import copy
+import hashlib
+import io
+import json
 import os
+import functools
 import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, Optional
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import cm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, PageBreak
+from operator import itemgetter
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional, Set, Tuple
 
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -19,16 +23,84 @@ logger = logging.getLogger(__name__)
 # Путь к директории для сохранения PDF
 PDF_STORAGE_PATH = os.environ.get('PDF_STORAGE_PATH', './pdfs')
 
+# Маска прав процесса (os.umask позволяет прочитать ее только вместе с установкой)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# Директории, уже созданные этим процессом
+_ENSURED: Set[str] = set()
+
+def _ensure(path: str) -> None:
+    """
+    Создает директорию не более одного раза за время жизни процесса
+    """
+    if path not in _ENSURED:
+        os.makedirs(path, exist_ok=True)
+        _ENSURED.add(path)
+
 # Создаем директорию для хранения PDF, если она не существует
-os.makedirs(PDF_STORAGE_PATH, exist_ok=True)
+_ensure(PDF_STORAGE_PATH)
+
+# reportlab и все, что от него зависит, загружается при первом отчете
+_RL: Optional[SimpleNamespace] = None
+
+def _rl() -> SimpleNamespace:
+    """
+    Импортирует reportlab при первом обращении и один раз готовит стили, шрифт и параметры страницы
+    """
+    global _RL
+    if _RL is None:
+        from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+        from reportlab.lib.pagesizes import A4
+        from reportlab.lib.styles import getSampleStyleSheet
+        from reportlab.lib.units import cm
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        from reportlab.pdfgen import canvas
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+        
+        # Стили для содержимого создаются один раз и используются только для чтения
+        styles = getSampleStyleSheet()
+        title, h1, h2, normal = styles['Title'], styles['Heading1'], styles['Heading2'], styles['Normal']
+        
+        # Шрифт с поддержкой кириллицы регистрируется один раз, а не при каждом отчете
+        try:
+            pdfmetrics.registerFont(TTFont('DejaVuSans', 'DejaVuSans.ttf'))
+            for style in (title, h1, h2, normal):
+                style.fontName = 'DejaVuSans'
+        except Exception:
+            # Если шрифт не найден, остаются стандартные шрифты reportlab
+            logger.warning("Шрифт DejaVuSans не найден, используются стандартные шрифты")
+        
+        # Абзацы с текстами по умолчанию разбираются один раз; Paragraph хранит состояние
+        # верстки (wrap/split), поэтому в отчет попадает поверхностная копия
+        default_paragraphs = {
+            text: Paragraph(text, normal)
+            for text in [default for _, default in _REPORT_FIELDS] + [default for _, _, default in _COMPATIBILITY_FIELDS]
+        }
+        
+        _RL = SimpleNamespace(
+            TA_CENTER=TA_CENTER, TA_RIGHT=TA_RIGHT, cm=cm,
+            Canvas=canvas.Canvas, stringWidth=pdfmetrics.stringWidth,
+            SimpleDocTemplate=SimpleDocTemplate, Paragraph=Paragraph, Spacer=Spacer, PageBreak=PageBreak,
+            title=title, h1=h1, h2=h2, normal=normal,
+            default_paragraphs=default_paragraphs,
+            # Параметры страницы, общие для всех документов
+            page_kw=dict(pagesize=A4, rightMargin=2*cm, leftMargin=2*cm, topMargin=2*cm, bottomMargin=2*cm),
+        )
+    return _RL
+
+# Элемент макета отчета: (текст, стиль, отступ после) или None для разрыва страницы
+_LayoutItem = Optional[Tuple[Any, Any, float]]
+
+# Таблица замены недопустимых в имени файла символов и пробела
+_SANITIZE_TABLE = str.maketrans({char: '_' for char in '\\/:*?"<>| '})
 
 def sanitize_filename(filename: str) -> str:
     """
     Очищает имя файла от недопустимых символов
     """
-    for char in ['\\', '/', ':', '*', '?', '"', '<', '>', '|']:
-        filename = filename.replace(char, '_')
-    return filename.replace(' ', '_')
+    return filename.translate(_SANITIZE_TABLE)
 
 def get_user_directory(user_data: Dict[str, Any]) -> str:
     """
@@ -42,33 +114,396 @@ def get_user_directory(user_data: Dict[str, Any]) -> str:
     user_dir = os.path.join(PDF_STORAGE_PATH, sanitized_name)
     
     # Создаем директорию, если она не существует
-    os.makedirs(user_dir, exist_ok=True)
+    _ensure(user_dir)
     
     return user_dir
 
+# Поддерживаемые форматы строковых дат
+_DATE_FMTS = ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y")
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date_str(date_str: str) -> str:
+    """
+    Приводит строковую дату к формату ДД.ММ.ГГГГ (результат кешируется)
+    """
+    try:
+        # Пробуем разные форматы даты
+        for fmt in _DATE_FMTS:
+            try:
+                date_obj = datetime.strptime(date_str, fmt)
+                return date_obj.strftime('%d.%m.%Y')
+            except ValueError:
+                continue
+        # Если ни один формат не подошел, возвращаем как есть
+        return date_str
+    except Exception:
+        return date_str
+
 def format_date(date_value):
     """
     Форматирует дату в читаемый формат
     """
     if isinstance(date_value, str):
-        try:
-            # Пробуем разные форматы даты
-            for fmt in ["%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y"]:
-                try:
-                    date_obj = datetime.strptime(date_value, fmt)
-                    return date_obj.strftime('%d.%m.%Y')
-                except ValueError:
-                    continue
-            # Если ни один формат не подошел, возвращаем как есть
-            return date_value
-        except Exception:
-            return date_value
+        return _parse_date_str(date_value)
     elif hasattr(date_value, 'strftime'):
         # Если это объект даты
         return date_value.strftime('%d.%m.%Y')
     else:
         return str(date_value)
 
+# Числовые разделы отчета: заголовок, ключ интерпретации и ключ подробного анализа в контексте
+_NUMBER_SECTIONS = (
+    ("Число жизненного пути: {life_path}", 'life_path_interpretation', 'life_path_detailed'),
+    ("Число выражения: {expression}", 'expression_interpretation', 'expression_detailed'),
+    ("Число души: {soul_urge}", 'soul_interpretation', 'soul_detailed'),
+    ("Число личности: {personality}", 'personality_interpretation', 'personality_detailed'),
+)
+
+# Тексты из full_report и значения по умолчанию для пустых полей
+_REPORT_FIELDS = (
+    ('life_path_interpretation', "Интерпретация числа жизненного пути."),
+    ('expression_interpretation', "Интерпретация числа выражения."),
+    ('soul_interpretation', "Интерпретация числа души."),
+    ('personality_interpretation', "Интерпретация числа личности."),
+    ('life_path_detailed', "Подробный анализ числа жизненного пути."),
+    ('expression_detailed', "Подробный анализ числа выражения."),
+    ('soul_detailed', "Подробный анализ числа души."),
+    ('personality_detailed', "Подробный анализ числа личности."),
+    ('forecast', "Прогноз на ближайшее время."),
+    ('recommendations', "Рекомендации для вашего развития."),
+)
+
+# Поля compatibility_report: ключ в отчете, ключ в контексте и значение по умолчанию
+_COMPATIBILITY_FIELDS = (
+    ('intro', 'compatibility_intro', "Анализ совместимости между двумя людьми."),
+    ('strengths', 'compatibility_strengths', "Анализ сильных сторон отношений."),
+    ('challenges', 'compatibility_challenges', "Анализ возможных трудностей в отношениях."),
+    ('recommendations', 'compatibility_recommendations', "Рекомендации для улучшения отношений."),
+)
+
+# Шаблоны текстового отчета, заполняются через str.format_map(ctx)
+_TEXT_HEAD = (
+    "Отчет для: {user_name}\n"
+    "Дата рождения: {birthdate}\n"
+    "Дата составления: {current_date}\n\n"
+    "ВВЕДЕНИЕ\n"
+    "----------------------------------------\n"
+    "{introduction}\n\n"
+)
+_TEXT_COMPATIBILITY = (
+    "{compatibility_intro}\n\n"
+    "Общая совместимость: {compatibility_score}%\n\n"
+    "Сильные стороны отношений:\n"
+    "{compatibility_strengths}\n\n"
+    "Возможные трудности:\n"
+    "{compatibility_challenges}\n\n"
+    "Рекомендации:\n"
+    "{compatibility_recommendations}\n\n"
+)
+_TEXT_TAIL = (
+    "ПРОГНОЗ И РЕКОМЕНДАЦИИ\n"
+    "----------------------------------------\n"
+    "{forecast}\n\n"
+    "Личные рекомендации:\n"
+    "{recommendations}\n\n"
+    "==================================================\n"
+    "© ИИ-Нумеролог {current_year}. Все права защищены.\n"
+    "Данный отчет сгенерирован с использованием искусственного интеллекта.\n"
+    "Для получения обновлений и еженедельных прогнозов подпишитесь в Telegram-боте.\n"
+)
+
+def _build_ctx(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
+               interpretation_data: Dict[str, Any], report_type: str = 'full',
+               now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Собирает все значения отчета в один плоский словарь для PDF и текстового отчета
+    """
+    # Все даты отчета берутся из одного момента времени
+    now = now or datetime.now()
+    
+    # Получаем данные из интерпретации
+    mini_report = None
+    full_report = None
+    compatibility_report = None
+    
+    if isinstance(interpretation_data, dict):
+        mini_report = interpretation_data.get('mini_report')
+        full_report = interpretation_data.get('full_report')
+        compatibility_report = interpretation_data.get('compatibility_report')
+    else:
+        mini_report = str(interpretation_data)
+    
+    # Отчеты другого типа считаются пустыми, дальше проверки типа не нужны
+    full_report = full_report if isinstance(full_report, dict) else {}
+    compatibility_report = compatibility_report if isinstance(compatibility_report, dict) else {}
+    
+    # Введение
+    if 'introduction' in full_report:
+        introduction = full_report['introduction']
+    else:
+        introduction = mini_report or "Персональный нумерологический анализ на основе ваших данных."
+    
+    ctx = {
+        'user_name': user_data.get('fio', 'Пользователь'),
+        'birthdate': format_date(user_data.get('birthdate', '')),
+        'current_date': now.strftime('%d.%m.%Y'),
+        'current_year': now.year,
+        'introduction': introduction,
+        'life_path': numerology_data.get('life_path', ''),
+        'expression': numerology_data.get('expression', ''),
+        'soul_urge': numerology_data.get('soul_urge', ''),
+        'personality': numerology_data.get('personality', ''),
+        'compatibility': report_type == 'compatibility',
+        'compatibility_score': compatibility_report.get('score', 75),
+    }
+    
+    # Интерпретации, подробный анализ, прогноз и рекомендации
+    ctx.update({key: full_report.get(key, '') or default for key, default in _REPORT_FIELDS})
+    
+    # Данные о совместимости
+    ctx.update({name: compatibility_report.get(key, '') or default
+                for key, name, default in _COMPATIBILITY_FIELDS})
+    
+    return ctx
+
+def _number_sections(text_index: int) -> tuple:
+    """
+    Строит разделы макета для четырех ключевых чисел (интерпретации или подробный анализ)
+    """
+    items = []
+    for section in _NUMBER_SECTIONS:
+        items.append((section[0], 'h2', 0))
+        items.append((itemgetter(section[text_index]), 'normal', 0.3))
+    # После последнего числа отступ больше
+    items[-1] = items[-1][:2] + (0.5,)
+    return tuple(items)
+
+# Макет PDF-отчета после заголовка: (текст, стиль, отступ после в см) или None для разрыва страницы.
+# Текст - шаблон для str.format_map либо itemgetter, если значение контекста берется как есть
+_PDF_SECTIONS = (
+    # Информация о пользователе
+    ("Отчет для: {user_name}", 'h1', 0),
+    ("Дата рождения: {birthdate}", 'normal', 0),
+    ("Дата составления: {current_date}", 'normal', 1),
+    # Введение
+    ("Введение", 'h1', 0),
+    (itemgetter('introduction'), 'normal', 0.5),
+    # Ключевые числа и их интерпретации
+    ("Ключевые числа вашей судьбы", 'h1', 0),
+) + _number_sections(1) + (
+    None,
+    # Подробный анализ
+    ("Подробный анализ чисел", 'h1', 0),
+) + _number_sections(2)
+
+_PDF_COMPATIBILITY_SECTIONS = (
+    None,
+    ("Анализ совместимости", 'h1', 0),
+    (itemgetter('compatibility_intro'), 'normal', 0.3),
+    ("Общая совместимость: {compatibility_score}%", 'h2', 0.3),
+    ("Сильные стороны отношений", 'h2', 0),
+    (itemgetter('compatibility_strengths'), 'normal', 0.3),
+    ("Возможные трудности", 'h2', 0),
+    (itemgetter('compatibility_challenges'), 'normal', 0.3),
+    ("Рекомендации", 'h2', 0),
+    (itemgetter('compatibility_recommendations'), 'normal', 0),
+)
+
+_PDF_TAIL_SECTIONS = (
+    None,
+    # Прогноз и рекомендации
+    ("Прогноз и рекомендации", 'h1', 0),
+    (itemgetter('forecast'), 'normal', 0.3),
+    ("Личные рекомендации", 'h2', 0),
+    (itemgetter('recommendations'), 'normal', 1),
+    # Футер
+    ("© ИИ-Нумеролог {current_year}. Все права защищены.", 'normal', 0),
+    ("Данный отчет сгенерирован с использованием искусственного интеллекта на основе нумерологических расчетов.", 'normal', 0),
+    ("Для получения обновлений и еженедельных прогнозов подпишитесь в Telegram-боте.", 'normal', 0),
+)
+
+def _layout(ctx: Dict[str, Any]) -> List[_LayoutItem]:
+    """
+    Описывает отчет как список абзацев (текст, стиль, отступ после) и разрывов страниц (None)
+    """
+    rl = _rl()
+    cm = rl.cm
+    
+    # Заголовок
+    if ctx['compatibility']:
+        report_title = "Отчет о нумерологической совместимости"
+    else:
+        report_title = "Нумерологический отчет"
+    
+    sections = _PDF_SECTIONS
+    if ctx['compatibility']:
+        sections += _PDF_COMPATIBILITY_SECTIONS
+    sections += _PDF_TAIL_SECTIONS
+    
+    layout = [(report_title, rl.title, 0.5*cm)]
+    layout += [
+        None if section is None else (
+            section[0](ctx) if callable(section[0]) else section[0].format_map(ctx),
+            getattr(rl, section[1]),
+            section[2]*cm,
+        )
+        for section in sections
+    ]
+    return layout
+
+def _build_story(layout: List[_LayoutItem]) -> list:
+    """
+    Превращает макет отчета в элементы platypus (список создается сразу нужной длины)
+    """
+    rl = _rl()
+    story = [None] * (len(layout) + sum(1 for item in layout if item and item[2]))
+    i = 0
+    for item in layout:
+        if item is None:
+            story[i] = rl.PageBreak()
+            i += 1
+            continue
+        text, style, space_after = item
+        default = rl.default_paragraphs.get(text) if style is rl.normal and isinstance(text, str) else None
+        story[i] = copy.copy(default) if default is not None else rl.Paragraph(text, style)
+        i += 1
+        if space_after:
+            story[i] = rl.Spacer(1, space_after)
+            i += 1
+    return story
+
+# Символы разметки reportlab: такие абзацы рисует только Paragraph
+_MARKUP_CHARS = frozenset('<>&')
+
+# Внутренний отступ фрейма SimpleDocTemplate (значение Frame по умолчанию)
+_FRAME_PADDING = 6
+
+def _wrap_words(text: str, font_name: str, font_size: float, width: float,
+                space_shrinkage: float = 0.0) -> Optional[List[str]]:
+    """
+    Жадно разбивает текст на строки заданной ширины.
+    Как и Paragraph, допускает превышение ширины на space_shrinkage ширины пробела на каждый пробел строки.
+    Возвращает None, если отдельное слово не помещается в строку.
+    """
+    stringWidth = _rl().stringWidth
+    space_width = stringWidth(' ', font_name, font_size)
+    shrink = space_shrinkage * space_width
+    lines = []
+    line_words = []
+    line_width = 0.0
+    for word in text.split():
+        word_width = stringWidth(word, font_name, font_size)
+        if word_width > width:
+            return None
+        if line_words and line_width + space_width + word_width > width + shrink * len(line_words):
+            lines.append(' '.join(line_words))
+            line_words = []
+            line_width = 0.0
+        line_width += (space_width if line_words else 0) + word_width
+        line_words.append(word)
+    if line_words:
+        lines.append(' '.join(line_words))
+    return lines
+
+def _render_canvas(layout: List[_LayoutItem], out) -> bool:
+    """
+    Рисует отчет напрямую на холсте reportlab, минуя движок platypus.
+    Макет отчета фиксированный, поэтому достаточно разбить абзацы на строки
+    и переносить строки на новую страницу по достижении нижнего поля.
+    
+    Returns:
+        bool: False, если макет нужно собирать через platypus (разметка в тексте,
+        нестроковый текст или слишком длинное слово); в этом случае в out ничего не записывается
+    """
+    rl = _rl()
+    page_kw = rl.page_kw
+    page_width, page_height = page_kw['pagesize']
+    # Область текста та же, что у фрейма SimpleDocTemplate: поля страницы плюс отступ фрейма
+    left = page_kw['leftMargin'] + _FRAME_PADDING
+    width = page_width - page_kw['leftMargin'] - page_kw['rightMargin'] - 2 * _FRAME_PADDING
+    top = page_height - page_kw['topMargin'] - _FRAME_PADDING
+    bottom = page_kw['bottomMargin'] + _FRAME_PADDING
+    
+    # Сначала разбиваем все абзацы на строки, чтобы не начинать рисование, если нужен platypus
+    blocks = []
+    for item in layout:
+        if item is None:
+            blocks.append(None)
+            continue
+        text, style, space_after = item
+        if not isinstance(text, str) or not _MARKUP_CHARS.isdisjoint(text):
+            return False
+        lines = _wrap_words(text, style.fontName, style.fontSize, width, getattr(style, 'spaceShrinkage', 0.0))
+        if lines is None:
+            return False
+        blocks.append((lines, style, space_after))
+    
+    c = rl.Canvas(out, pagesize=page_kw['pagesize'])
+    y = top
+    at_top = True
+    prev_space = 0.0
+    for block in blocks:
+        if block is None:
+            # Разрыв страницы
+            if not at_top:
+                c.showPage()
+                y = top
+                at_top = True
+            continue
+        lines, style, space_after = block
+        # Как и во фрейме platypus, отступ перед абзацем поглощается отступом после предыдущего
+        if not at_top:
+            y -= max(style.spaceBefore - prev_space, 0)
+        
+        # Как и platypus (allowOrphans=0), не оставляем внизу страницы одну первую строку абзаца
+        if len(lines) > 1 and not at_top and y - 2 * style.leading < bottom <= y - style.leading:
+            c.showPage()
+            y = top
+        
+        for line in lines:
+            # Строка не помещается - продолжаем абзац на следующей странице
+            if y - style.leading < bottom:
+                c.showPage()
+                y = top
+            c.setFont(style.fontName, style.fontSize)
+            c.setFillColor(style.textColor)
+            baseline = y - style.fontSize
+            if style.alignment == rl.TA_CENTER:
+                c.drawCentredString(left + width / 2, baseline, line)
+            elif style.alignment == rl.TA_RIGHT:
+                c.drawRightString(left + width, baseline, line)
+            else:
+                c.drawString(left, baseline, line)
+            y -= style.leading
+        
+        y -= style.spaceAfter
+        if space_after:
+            # В platypus отступ после абзаца - отдельный Spacer: если он не помещается внизу,
+            # то переносится на следующую страницу, и она уже не считается пустой
+            if y - space_after < bottom:
+                c.showPage()
+                y = top
+            y -= space_after
+        prev_space = 0 if space_after else style.spaceAfter
+        at_top = False
+    
+    c.save()
+    return True
+
+def _content_key(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
+                 interpretation_data: Dict[str, Any], report_type: str, now: datetime) -> Optional[str]:
+    """
+    Вычисляет хеш входных данных отчета для имени файла.
+    В хеш входит дата составления, поэтому готовый отчет переиспользуется только в тот же день.
+    Возвращает None, если данные не сериализуются в JSON.
+    """
+    try:
+        payload = json.dumps([user_data, numerology_data, interpretation_data, report_type, now.strftime('%Y%m%d')],
+                             sort_keys=True, default=str)
+    except (TypeError, ValueError):
+        return None
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
 def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
                 interpretation_data: Dict[str, Any], report_type: str = 'full') -> Optional[str]:
     """
@@ -84,221 +519,62 @@ def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
     Returns:
         str: Путь к сгенерированному отчету или None в случае ошибки
     """
+    # Имя файла, дата составления и год в футере используют одно и то же время
+    now = datetime.now()
+    timestamp = now.strftime('%Y%m%d_%H%M%S')
+    
     try:
         # Получаем директорию пользователя
         user_dir = get_user_directory(user_data)
         
-        # Форматируем дату рождения
-        birthdate_formatted = format_date(user_data.get('birthdate', ''))
-        
-        # Формируем имя файла
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        # Формируем имя файла: по хешу входных данных, если их удается сериализовать
         user_id = user_data.get('id', '1')
-        file_prefix = f"{user_id}_{report_type}"
+        key = _content_key(user_data, numerology_data, interpretation_data, report_type, now)
+        file_prefix = f"{user_id}_{report_type}_{key or timestamp}"
         
         # Пути к файлам
-        pdf_path = os.path.join(user_dir, f"{file_prefix}_{timestamp}.pdf")
-        txt_path = os.path.join(user_dir, f"{file_prefix}_{timestamp}.txt")
+        pdf_path = os.path.join(user_dir, f"{file_prefix}.pdf")
+        txt_path = os.path.join(user_dir, f"{file_prefix}.txt")
+        
+        # Такой же отчет уже сгенерирован сегодня (например, повторное нажатие кнопки)
+        if key and os.path.exists(pdf_path):
+            logger.info(f"PDF отчет уже существует: {pdf_path}")
+            return pdf_path
+        
+        # Все значения отчета вычисляются один раз
+        ctx = _build_ctx(user_data, numerology_data, interpretation_data, report_type, now=now)
         
         try:
-            # Генерируем PDF с использованием reportlab
-            doc = SimpleDocTemplate(pdf_path, pagesize=A4, 
-                                   rightMargin=2*cm, leftMargin=2*cm, 
-                                   topMargin=2*cm, bottomMargin=2*cm)
-            
-            # Стили для содержимого
-            styles = getSampleStyleSheet()
-            title_style = styles['Title']
-            heading_style = styles['Heading1']
-            subheading_style = styles['Heading2']
-            normal_style = styles['Normal']
-            
-            # Создаем элементы PDF
-            story = []
-            
-            # Заголовок
-            if report_type == 'compatibility':
-                report_title = "Отчет о нумерологической совместимости"
-            else:
-                report_title = "Нумерологический отчет"
-            story.append(Paragraph(report_title, title_style))
-            story.append(Spacer(1, 0.5*cm))
-            
-            # Информация о пользователе
-            story.append(Paragraph(f"Отчет для: {user_data.get('fio', 'Пользователь')}", heading_style))
-            story.append(Paragraph(f"Дата рождения: {birthdate_formatted}", normal_style))
-            story.append(Paragraph(f"Дата составления: {datetime.now().strftime('%d.%m.%Y')}", normal_style))
-            story.append(Spacer(1, 1*cm))
-            
-            # Получаем данные из интерпретации
-            mini_report = None
-            full_report = None
-            
-            if isinstance(interpretation_data, dict):
-                mini_report = interpretation_data.get('mini_report')
-                full_report = interpretation_data.get('full_report', {})
-            else:
-                mini_report = str(interpretation_data)
-            
-            # Введение
-            introduction = ""
-            if isinstance(full_report, dict) and 'introduction' in full_report:
-                introduction = full_report['introduction']
-            elif mini_report:
-                introduction = mini_report
-            else:
-                introduction = "Персональный нумерологический анализ на основе ваших данных."
-                
-            story.append(Paragraph("Введение", heading_style))
-            story.append(Paragraph(introduction, normal_style))
-            story.append(Spacer(1, 0.5*cm))
-            
-            # Ключевые числа и их интерпретации
-            story.append(Paragraph("Ключевые числа вашей судьбы", heading_style))
-            
-            # Получаем значения чисел
-            life_path = numerology_data.get('life_path', '')
-            expression = numerology_data.get('expression', '')
-            soul_urge = numerology_data.get('soul_urge', '')
-            personality = numerology_data.get('personality', '')
-            
-            # Получаем интерпретации
-            life_path_interp = ""
-            expression_interp = ""
-            soul_interp = ""
-            personality_interp = ""
-            
-            if isinstance(full_report, dict):
-                life_path_interp = full_report.get('life_path_interpretation', '')
-                expression_interp = full_report.get('expression_interpretation', '')
-                soul_interp = full_report.get('soul_interpretation', '')
-                personality_interp = full_report.get('personality_interpretation', '')
-            
-            # Добавляем информацию о числах
-            story.append(Paragraph(f"Число жизненного пути: {life_path}", subheading_style))
-            story.append(Paragraph(life_path_interp or "Интерпретация числа жизненного пути.", normal_style))
-            story.append(Spacer(1, 0.3*cm))
-            
-            story.append(Paragraph(f"Число выражения: {expression}", subheading_style))
-            story.append(Paragraph(expression_interp or "Интерпретация числа выражения.", normal_style))
-            story.append(Spacer(1, 0.3*cm))
-            
-            story.append(Paragraph(f"Число души: {soul_urge}", subheading_style))
-            story.append(Paragraph(soul_interp or "Интерпретация числа души.", normal_style))
-            story.append(Spacer(1, 0.3*cm))
-            
-            story.append(Paragraph(f"Число личности: {personality}", subheading_style))
-            story.append(Paragraph(personality_interp or "Интерпретация числа личности.", normal_style))
-            story.append(Spacer(1, 0.5*cm))
-            
-            # Новая страница
-            story.append(PageBreak())
-            
-            # Подробный анализ
-            story.append(Paragraph("Подробный анализ чисел", heading_style))
-            
-            # Получаем подробные интерпретации
-            life_path_detailed = ""
-            expression_detailed = ""
-            soul_detailed = ""
-            personality_detailed = ""
-            
-            if isinstance(full_report, dict):
-                life_path_detailed = full_report.get('life_path_detailed', '')
-                expression_detailed = full_report.get('expression_detailed', '')
-                soul_detailed = full_report.get('soul_detailed', '')
-                personality_detailed = full_report.get('personality_detailed', '')
-            
-            # Добавляем подробные интерпретации
-            story.append(Paragraph(f"Число жизненного пути: {life_path}", subheading_style))
-            story.append(Paragraph(life_path_detailed or "Подробный анализ числа жизненного пути.", normal_style))
-            story.append(Spacer(1, 0.3*cm))
-            
-            story.append(Paragraph(f"Число выражения: {expression}", subheading_style))
-            story.append(Paragraph(expression_detailed or "Подробный анализ числа выражения.", normal_style))
-            story.append(Spacer(1, 0.3*cm))
-            
-            story.append(Paragraph(f"Число души: {soul_urge}", subheading_style))
-            story.append(Paragraph(soul_detailed or "Подробный анализ числа души.", normal_style))
-            story.append(Spacer(1, 0.3*cm))
-            
-            story.append(Paragraph(f"Число личности: {personality}", subheading_style))
-            story.append(Paragraph(personality_detailed or "Подробный анализ числа личности.", normal_style))
-            story.append(Spacer(1, 0.5*cm))
-            
-            # Для отчета о совместимости
-            if report_type == 'compatibility':
-                # Новая страница
-                story.append(PageBreak())
-                
-                # Добавление информации о совместимости
-                story.append(Paragraph("Анализ совместимости", heading_style))
-                
-                compatibility_report = interpretation_data.get('compatibility_report', {})
-                
-                if isinstance(compatibility_report, dict):
-                    # Интро и оценка
-                    compatibility_intro = compatibility_report.get('intro', '')
-                    story.append(Paragraph(compatibility_intro or "Анализ совместимости между двумя людьми.", normal_style))
-                    story.append(Spacer(1, 0.3*cm))
-                    
-                    compatibility_score = compatibility_report.get('score', 75)
-                    story.append(Paragraph(f"Общая совместимость: {compatibility_score}%", subheading_style))
-                    story.append(Spacer(1, 0.3*cm))
-                    
-                    # Сильные стороны
-                    compatibility_strengths = compatibility_report.get('strengths', '')
-                    story.append(Paragraph("Сильные стороны отношений", subheading_style))
-                    story.append(Paragraph(compatibility_strengths or "Анализ сильных сторон отношений.", normal_style))
-                    story.append(Spacer(1, 0.3*cm))
-                    
-                    # Трудности
-                    compatibility_challenges = compatibility_report.get('challenges', '')
-                    story.append(Paragraph("Возможные трудности", subheading_style))
-                    story.append(Paragraph(compatibility_challenges or "Анализ возможных трудностей в отношениях.", normal_style))
-                    story.append(Spacer(1, 0.3*cm))
-                    
-                    # Рекомендации
-                    compatibility_recommendations = compatibility_report.get('recommendations', '')
-                    story.append(Paragraph("Рекомендации", subheading_style))
-                    story.append(Paragraph(compatibility_recommendations or "Рекомендации для улучшения отношений.", normal_style))
-            
-            # Новая страница
-            story.append(PageBreak())
-            
-            # Прогноз и рекомендации
-            story.append(Paragraph("Прогноз и рекомендации", heading_style))
-            
-            # Получаем прогноз и рекомендации
-            forecast = ""
-            recommendations = ""
-            
-            if isinstance(full_report, dict):
-                forecast = full_report.get('forecast', '')
-                recommendations = full_report.get('recommendations', '')
-            
-            # Добавляем прогноз и рекомендации
-            story.append(Paragraph(forecast or "Прогноз на ближайшее время.", normal_style))
-            story.append(Spacer(1, 0.3*cm))
-            
-            story.append(Paragraph("Личные рекомендации", subheading_style))
-            story.append(Paragraph(recommendations or "Рекомендации для вашего развития.", normal_style))
-            
-            # Футер
-            story.append(Spacer(1, 1*cm))
-            current_year = datetime.now().year
-            footer_text = f"© ИИ-Нумеролог {current_year}. Все права защищены."
-            story.append(Paragraph(footer_text, normal_style))
-            story.append(Paragraph("Данный отчет сгенерирован с использованием искусственного интеллекта на основе нумерологических расчетов.", normal_style))
-            story.append(Paragraph("Для получения обновлений и еженедельных прогнозов подпишитесь в Telegram-боте.", normal_style))
-            
-            # Собираем PDF
-            doc.build(story)
+            # Генерируем PDF в памяти: фиксированный макет рисуется прямо на холсте,
+            # platypus используется только для абзацев, с которыми холст не справляется
+            layout = _layout(ctx)
+            buf = io.BytesIO()
+            if not _render_canvas(layout, buf):
+                rl = _rl()
+                doc = rl.SimpleDocTemplate(buf, **rl.page_kw)
+                doc.build(_build_story(layout))
+            
+            # Записываем файл одним вызовом; под итоговым именем он появляется только целиком.
+            # Временный файл у каждого процесса свой: одинаковые задания пакета получают одно итоговое имя
+            fd, part_path = tempfile.mkstemp(dir=user_dir, prefix=f"{file_prefix}.", suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    # mkstemp создает файл с правами 0600; отчет получает обычные права с учетом umask процесса
+                    if hasattr(os, 'fchmod'):
+                        os.fchmod(fd, 0o644 & ~_UMASK)
+                    f.write(buf.getvalue())
+                os.replace(part_path, pdf_path)
+            except Exception:
+                try:
+                    os.remove(part_path)
+                except OSError:
+                    pass
+                raise
             
             logger.info(f"PDF отчет успешно сгенерирован: {pdf_path}")
             
             # Также создаем текстовый отчет как резервную копию
-            generate_text_report(user_data, numerology_data, interpretation_data, txt_path, report_type)
+            generate_text_report(ctx, txt_path)
             
             return pdf_path
             
@@ -307,7 +583,7 @@ def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
             logger.warning("Создание текстового отчета вместо PDF")
             
             # Создаем текстовый отчет вместо PDF
-            txt_path = generate_text_report(user_data, numerology_data, interpretation_data, txt_path, report_type)
+            txt_path = generate_text_report(ctx, txt_path)
             return txt_path
             
     except Exception as e:
@@ -316,184 +592,96 @@ def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
         # В случае ошибки пытаемся создать простой текстовый отчет
         try:
             emergency_path = os.path.join(PDF_STORAGE_PATH, f"emergency_{timestamp}.txt")
-            return generate_text_report(user_data, numerology_data, interpretation_data, emergency_path, report_type)
+            return generate_text_report_legacy(user_data, numerology_data, interpretation_data, emergency_path,
+                                               report_type, now=now)
         except Exception as e2:
             logger.error(f"Не удалось создать даже аварийный отчет: {e2}")
             return None
 
 
-def generate_text_report(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
-                       interpretation_data: Dict[str, Any], output_path: str, report_type: str = 'full') -> str:
+def _gen_one(job: Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], str]) -> Optional[str]:
+    """
+    Генерирует один отчет в рабочем процессе (функция уровня модуля, чтобы ее можно было передать в пул).
+    """
+    return generate_pdf(*job)
+
+
+def generate_pdfs_batch(jobs: List[Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any], str]],
+                        max_workers: Optional[int] = None) -> List[Optional[str]]:
     """
-    Генерирует текстовый отчет на основе данных.
+    Генерирует несколько отчетов параллельно в пуле процессов.
+    Сборка PDF в reportlab не отпускает GIL, поэтому каждый отчет строится в отдельном процессе.
     
     Args:
-        user_data: Данные пользователя
-        numerology_data: Результаты нумерологических расчетов
-        interpretation_data: Интерпретация от внешнего сервиса
+        jobs: Список кортежей (user_data, numerology_data, interpretation_data, report_type)
+        max_workers: Количество процессов (по умолчанию - число ядер)
+        
+    Returns:
+        List[Optional[str]]: Пути к сгенерированным отчетам в порядке jobs
+    """
+    if not jobs:
+        return []
+    
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        return list(executor.map(_gen_one, jobs))
+
+
+def generate_text_report(ctx: Dict[str, Any], output_path: str) -> str:
+    """
+    Генерирует текстовый отчет по готовому контексту.
+    
+    Args:
+        ctx: Значения отчета, собранные _build_ctx
         output_path: Путь к выходному файлу
-        report_type: Тип отчета ('full' или 'compatibility')
         
     Returns:
         str: Путь к сгенерированному текстовому отчету
     """
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            # Заголовок
-            f.write("==================================================\n")
-            if report_type == 'compatibility':
-                f.write("ОТЧЕТ О НУМЕРОЛОГИЧЕСКОЙ СОВМЕСТИМОСТИ\n")
-            else:
-                f.write("НУМЕРОЛОГИЧЕСКИЙ ОТЧЕТ\n")
-            f.write("==================================================\n\n")
-            
-            # Информация о пользователе
-            f.write(f"Отчет для: {user_data.get('fio', 'Пользователь')}\n")
-            f.write(f"Дата рождения: {format_date(user_data.get('birthdate', ''))}\n")
-            f.write(f"Дата составления: {datetime.now().strftime('%d.%m.%Y')}\n\n")
-            
-            # Получаем данные из интерпретации
-            mini_report = None
-            full_report = None
-            
-            if isinstance(interpretation_data, dict):
-                mini_report = interpretation_data.get('mini_report')
-                full_report = interpretation_data.get('full_report', {})
-            else:
-                mini_report = str(interpretation_data)
-            
-            # Введение
-            introduction = ""
-            if isinstance(full_report, dict) and 'introduction' in full_report:
-                introduction = full_report['introduction']
-            elif mini_report:
-                introduction = mini_report
-            else:
-                introduction = "Персональный нумерологический анализ на основе ваших данных."
-                
-            f.write("ВВЕДЕНИЕ\n")
-            f.write(f"{'-' * 40}\n")
-            f.write(f"{introduction}\n\n")
-            
-            # Ключевые числа
-            f.write("КЛЮЧЕВЫЕ ЧИСЛА ВАШЕЙ СУДЬБЫ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            # Получаем значения чисел
-            life_path = numerology_data.get('life_path', '')
-            expression = numerology_data.get('expression', '')
-            soul_urge = numerology_data.get('soul_urge', '')
-            personality = numerology_data.get('personality', '')
-            
-            # Получаем интерпретации
-            life_path_interp = ""
-            expression_interp = ""
-            soul_interp = ""
-            personality_interp = ""
-            
-            if isinstance(full_report, dict):
-                life_path_interp = full_report.get('life_path_interpretation', '')
-                expression_interp = full_report.get('expression_interpretation', '')
-                soul_interp = full_report.get('soul_interpretation', '')
-                personality_interp = full_report.get('personality_interpretation', '')
-            
-            # Добавляем информацию о числах
-            f.write(f"Число жизненного пути: {life_path}\n")
-            f.write(f"{life_path_interp or 'Интерпретация числа жизненного пути.'}\n\n")
-            
-            f.write(f"Число выражения: {expression}\n")
-            f.write(f"{expression_interp or 'Интерпретация числа выражения.'}\n\n")
-            
-            f.write(f"Число души: {soul_urge}\n")
-            f.write(f"{soul_interp or 'Интерпретация числа души.'}\n\n")
-            
-            f.write(f"Число личности: {personality}\n")
-            f.write(f"{personality_interp or 'Интерпретация числа личности.'}\n\n")
-            
-            # Подробный анализ
-            f.write("ПОДРОБНЫЙ АНАЛИЗ ЧИСЕЛ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            # Получаем подробные интерпретации
-            life_path_detailed = ""
-            expression_detailed = ""
-            soul_detailed = ""
-            personality_detailed = ""
-            
-            if isinstance(full_report, dict):
-                life_path_detailed = full_report.get('life_path_detailed', '')
-                expression_detailed = full_report.get('expression_detailed', '')
-                soul_detailed = full_report.get('soul_detailed', '')
-                personality_detailed = full_report.get('personality_detailed', '')
-            
-            # Добавляем подробные интерпретации
-            f.write(f"Число жизненного пути: {life_path}\n")
-            f.write(f"{life_path_detailed or 'Подробный анализ числа жизненного пути.'}\n\n")
-            
-            f.write(f"Число выражения: {expression}\n")
-            f.write(f"{expression_detailed or 'Подробный анализ числа выражения.'}\n\n")
-            
-            f.write(f"Число души: {soul_urge}\n")
-            f.write(f"{soul_detailed or 'Подробный анализ числа души.'}\n\n")
-            
-            f.write(f"Число личности: {personality}\n")
-            f.write(f"{personality_detailed or 'Подробный анализ числа личности.'}\n\n")
-            
-            # Для отчета о совместимости
-            if report_type == 'compatibility':
-                # Добавление информации о совместимости
-                f.write("АНАЛИЗ СОВМЕСТИМОСТИ\n")
-                f.write(f"{'-' * 40}\n")
-                
-                compatibility_report = interpretation_data.get('compatibility_report', {})
-                
-                if isinstance(compatibility_report, dict):
-                    # Интро и оценка
-                    compatibility_intro = compatibility_report.get('intro', '')
-                    f.write(f"{compatibility_intro or 'Анализ совместимости между двумя людьми.'}\n\n")
-                    
-                    compatibility_score = compatibility_report.get('score', 75)
-                    f.write(f"Общая совместимость: {compatibility_score}%\n\n")
-                    
-                    # Сильные стороны
-                    compatibility_strengths = compatibility_report.get('strengths', '')
-                    f.write("Сильные стороны отношений:\n")
-                    f.write(f"{compatibility_strengths or 'Анализ сильных сторон отношений.'}\n\n")
-                    
-                    # Трудности
-                    compatibility_challenges = compatibility_report.get('challenges', '')
-                    f.write("Возможные трудности:\n")
-                    f.write(f"{compatibility_challenges or 'Анализ возможных трудностей в отношениях.'}\n\n")
-                    
-                    # Рекомендации
-                    compatibility_recommendations = compatibility_report.get('recommendations', '')
-                    f.write("Рекомендации:\n")
-                    f.write(f"{compatibility_recommendations or 'Рекомендации для улучшения отношений.'}\n\n")
-            
-            # Прогноз и рекомендации
-            f.write("ПРОГНОЗ И РЕКОМЕНДАЦИИ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            # Получаем прогноз и рекомендации
-            forecast = ""
-            recommendations = ""
-            
-            if isinstance(full_report, dict):
-                forecast = full_report.get('forecast', '')
-                recommendations = full_report.get('recommendations', '')
-            
-            # Добавляем прогноз и рекомендации
-            f.write(f"{forecast or 'Прогноз на ближайшее время.'}\n\n")
-            
-            f.write("Личные рекомендации:\n")
-            f.write(f"{recommendations or 'Рекомендации для вашего развития.'}\n\n")
-            
-            # Футер
-            f.write(f"{'=' * 50}\n")
-            current_year = datetime.now().year
-            f.write(f"© ИИ-Нумеролог {current_year}. Все права защищены.\n")
-            f.write("Данный отчет сгенерирован с использованием искусственного интеллекта.\n")
-            f.write("Для получения обновлений и еженедельных прогнозов подпишитесь в Telegram-боте.\n")
+        # Отчет собирается в список строк и записывается в файл одним вызовом
+        parts: List[str] = []
+        
+        # Заголовок
+        parts.append("==================================================\n")
+        if ctx['compatibility']:
+            parts.append("ОТЧЕТ О НУМЕРОЛОГИЧЕСКОЙ СОВМЕСТИМОСТИ\n")
+        else:
+            parts.append("НУМЕРОЛОГИЧЕСКИЙ ОТЧЕТ\n")
+        parts.append("==================================================\n\n")
+        
+        # Информация о пользователе и введение
+        parts.append(_TEXT_HEAD.format_map(ctx))
+        
+        # Ключевые числа
+        parts.append("КЛЮЧЕВЫЕ ЧИСЛА ВАШЕЙ СУДЬБЫ\n")
+        parts.append(f"{'-' * 40}\n")
+        for heading, interp_key, _ in _NUMBER_SECTIONS:
+            parts.append(f"{heading.format_map(ctx)}\n{ctx[interp_key]}\n\n")
+        
+        # Подробный анализ
+        parts.append("ПОДРОБНЫЙ АНАЛИЗ ЧИСЕЛ\n")
+        parts.append(f"{'-' * 40}\n")
+        for heading, _, detailed_key in _NUMBER_SECTIONS:
+            parts.append(f"{heading.format_map(ctx)}\n{ctx[detailed_key]}\n\n")
+        
+        # Для отчета о совместимости
+        if ctx['compatibility']:
+            parts.append("АНАЛИЗ СОВМЕСТИМОСТИ\n")
+            parts.append(f"{'-' * 40}\n")
+            parts.append(_TEXT_COMPATIBILITY.format_map(ctx))
+        
+        # Прогноз, рекомендации и футер
+        parts.append(_TEXT_TAIL.format_map(ctx))
+        
+        # Отчет кодируется один раз и пишется в файловый дескриптор без буферов и кодека open()
+        blob = memoryview(''.join(parts).encode('utf-8'))
+        fd = os.open(output_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            # os.write может записать меньше запрошенного
+            while blob:
+                blob = blob[os.write(fd, blob):]
+        finally:
+            os.close(fd)
         
         logger.info(f"Текстовый отчет успешно сгенерирован: {output_path}")
         return output_path
@@ -505,10 +693,37 @@ def generate_text_report(user_data: Dict[str, Any], numerology_data: Dict[str, A
             simple_path = output_path.replace('.txt', '_simple.txt')
             with open(simple_path, 'w', encoding='utf-8') as f:
                 f.write("НУМЕРОЛОГИЧЕСКИЙ ОТЧЕТ\n\n")
-                f.write(f"Пользователь: {user_data.get('fio', 'Неизвестный')}\n")
-                f.write(f"Дата: {datetime.now().strftime('%d.%m.%Y')}\n\n")
+                f.write(f"Пользователь: {ctx.get('user_name', 'Неизвестный')}\n")
+                f.write(f"Дата: {ctx.get('current_date') or datetime.now().strftime('%d.%m.%Y')}\n\n")
                 f.write("Текст отчета не удалось отформатировать.\n")
             return simple_path
         except:
             # Если все не получилось, возвращаем исходный путь даже без файла
-            return output_path
\ No newline at end of file
+            return output_path
+
+
+def generate_text_report_legacy(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
+                                interpretation_data: Dict[str, Any], output_path: str,
+                                report_type: str = 'full', now: Optional[datetime] = None) -> str:
+    """
+    Генерирует текстовый отчет по исходным данным (прежняя сигнатура generate_text_report).
+    
+    Args:
+        user_data: Данные пользователя
+        numerology_data: Результаты нумерологических расчетов
+        interpretation_data: Интерпретация от внешнего сервиса
+        output_path: Путь к выходному файлу
+        report_type: Тип отчета ('full' или 'compatibility')
+        now: Время составления отчета (по умолчанию - текущее)
+        
+    Returns:
+        str: Путь к сгенерированному текстовому отчету
+    """
+    try:
+        ctx = _build_ctx(user_data, numerology_data, interpretation_data, report_type, now=now)
+    except Exception as e:
+        logger.error(f"Ошибка при подготовке данных текстового отчета: {e}")
+        # Для простого отчета достаточно имени пользователя
+        ctx = {'user_name': user_data.get('fio', 'Неизвестный')}
+    
+    return generate_text_report(ctx, output_path)
@@ -14,8 +14,11 @@ test_data = {
     "personality": 8
 }
 
+# Сессия переиспользует TCP-соединение при повторных запросах
+session = requests.Session()
+
 # Отправка запроса
-response = requests.post(n8n_webhook_url, json=test_data)
+response = session.post(n8n_webhook_url, json=test_data, timeout=30)
 
 # Вывод результатов
 print(f"Статус: {response.status_code}")
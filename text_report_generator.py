@@ -3,9 +3,14 @@
 """
 
 import os
+import mmap
+import hashlib
 import logging
-from datetime import datetime
-from typing import Dict, Any, Optional
+import pathlib
+import threading
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Dict, Any, Optional, Tuple
 
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -14,122 +19,209 @@ logger = logging.getLogger(__name__)
 # Путь к директории для сохранения отчетов
 PDF_STORAGE_PATH = os.environ.get('PDF_STORAGE_PATH', './pdfs')
 
-# Создаем директорию для хранения отчетов, если она не существует
-os.makedirs(PDF_STORAGE_PATH, exist_ok=True)
+# Директория хранения разбирается в Path один раз; создаем ее, если она не существует
+_STORAGE = pathlib.Path(PDF_STORAGE_PATH)
+_STORAGE.mkdir(parents=True, exist_ok=True)
+
+# Кратность длины и смещения записи для O_DIRECT (размер блока файловой системы)
+DIRECT_IO_ALIGNMENT = 4096
+
+# Сколько последних отчетов помнить для пропуска повторной записи одинакового содержимого
+REPORT_HASH_CACHE_SIZE = 1024
+
+# (user_id, report_type) -> (хэш содержимого, путь к файлу) последнего записанного отчета
+_last_hash: Dict[Tuple[Any, str], Tuple[bytes, str]] = {}
+_last_hash_lock = threading.Lock()
+
+# Разделители разделов отчета
+SEP = '=' * 50 + '\n'
+DASH = '-' * 40 + '\n'
+
+# Ключевые числа: подпись, поле расчета, поля краткой и подробной интерпретации
+_NUMBER_FIELDS = (
+    ("жизненного пути", "life_path", "life_path_interpretation", "life_path_detailed"),
+    ("выражения", "expression", "expression_interpretation", "expression_detailed"),
+    ("души", "soul_urge", "soul_interpretation", "soul_detailed"),
+    ("личности", "personality", "personality_interpretation", "personality_detailed"),
+)
+
+def _number_sections() -> str:
+    """
+    Собирает шаблоны разделов ключевых чисел и подробного анализа за один проход по _NUMBER_FIELDS
+    """
+    short, detailed = [], []
+    for label, key, short_key, detailed_key in _NUMBER_FIELDS:
+        head = f"Число {label}: {{{key}}}\n"
+        short.append(f"{head}{{{short_key}}}\n\n")
+        detailed.append(f"{head}{{{detailed_key}}}\n\n")
+    return ("КЛЮЧЕВЫЕ ЧИСЛА ВАШЕЙ СУДЬБЫ\n" + DASH + "".join(short)
+            + "ПОДРОБНЫЙ АНАЛИЗ ЧИСЕЛ\n" + DASH + "".join(detailed))
+
+# Шаблоны отчета заполняются через str.format_map; отсутствующие поля интерпретации дают пустую строку
+_REPORT_BODY = (
+    # Информация о пользователе
+    "Отчет для: {fio}\n"
+    "Дата рождения: {birthdate_formatted}\n"
+    "Дата составления: {current_date}\n\n"
+    # Введение
+    "ВВЕДЕНИЕ\n" + DASH +
+    "{introduction}\n\n"
+    # Ключевые числа и подробный анализ
+    + _number_sections()
+)
+
+# Дополнительная информация для отчета о совместимости
+_COMPATIBILITY_SECTION = (
+    "АНАЛИЗ СОВМЕСТИМОСТИ\n" + DASH +
+    "Общая совместимость: {score}%\n\n"
+    "Сильные стороны отношений:\n"
+    "{strengths}\n\n"
+    "Возможные трудности:\n"
+    "{challenges}\n\n"
+    "Рекомендации:\n"
+    "{recommendations}\n\n"
+)
+
+_REPORT_TAIL = (
+    # Прогноз и рекомендации
+    "ПРОГНОЗ И РЕКОМЕНДАЦИИ\n" + DASH +
+    "{forecast}\n\n"
+    "Личные рекомендации:\n"
+    "{recommendations}\n\n"
+    # Футер
+    + SEP +
+    "© ИИ-Нумеролог {year}. Все права защищены.\n"
+    "Данный отчет сгенерирован с использованием искусственного интеллекта.\n"
+    "Для получения обновлений и еженедельных прогнозов подпишитесь в Telegram-боте.\n"
+)
+
+_FULL_TEMPLATE = SEP + "НУМЕРОЛОГИЧЕСКИЙ ОТЧЕТ\n" + SEP + "\n" + _REPORT_BODY + _REPORT_TAIL
+_COMPAT_TEMPLATE = (SEP + "ОТЧЕТ О НУМЕРОЛОГИЧЕСКОЙ СОВМЕСТИМОСТИ\n" + SEP + "\n"
+                    + _REPORT_BODY + _COMPATIBILITY_SECTION + _REPORT_TAIL)
+
+def _parse_iso(value: str) -> date:
+    """
+    Разбирает дату в формате ГГГГ-ММ-ДД без strptime; нестандартную запись разбирает strptime
+    """
+    if (len(value) == 10 and value[4] == '-' and value[7] == '-' and value.isascii()
+            and value[:4].isdigit() and value[5:7].isdigit() and value[8:].isdigit()):
+        return date(int(value[:4]), int(value[5:7]), int(value[8:]))
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+def _format_date(value: date) -> str:
+    """
+    Форматирует дату как ДД.ММ.ГГГГ без strftime
+    """
+    return f"{value.day:02d}.{value.month:02d}.{value.year}"
+
+def _write_report(filepath: str, data: bytes) -> None:
+    """
+    Записывает готовый отчет в файловый дескриптор без буферов и кодека open()
+    """
+    # O_BINARY нужен только в Windows, чтобы не преобразовывались переводы строк
+    fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+    try:
+        view = memoryview(data)
+        # os.write может записать меньше запрошенного
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def _write_report_direct(filepath: str, data: bytes) -> None:
+    """
+    Записывает отчет в обход страничного кэша (O_DIRECT, только Linux).
+    
+    O_DIRECT требует, чтобы адрес буфера, длина и смещение записи были выровнены по блоку,
+    поэтому отчет копируется в буфер mmap (выровнен по странице) длиной, кратной
+    DIRECT_IO_ALIGNMENT, а дополнение нулями после записи отрезается ftruncate.
+    Если O_DIRECT недоступен или не поддерживается файловой системой, отчет записывается обычным способом.
+    """
+    o_direct = getattr(os, 'O_DIRECT', 0)
+    if not o_direct or not data:
+        _write_report(filepath, data)
+        return
+    
+    size = -(-len(data) // DIRECT_IO_ALIGNMENT) * DIRECT_IO_ALIGNMENT
+    try:
+        with mmap.mmap(-1, size) as buf:
+            buf[:len(data)] = data
+            fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | o_direct, 0o644)
+            try:
+                with memoryview(buf) as view:
+                    written = 0
+                    while written < size:
+                        written += os.write(fd, view[written:])
+                os.ftruncate(fd, len(data))
+            finally:
+                os.close(fd)
+    except OSError as e:
+        logger.warning(f"Запись в обход кэша недоступна ({e}), используется обычная запись")
+        _write_report(filepath, data)
 
 def generate_pdf(user_data: Dict[str, Any], numerology_data: Dict[str, Any],
-                interpretation_data: Dict[str, Any], report_type: str = 'full') -> Optional[str]:
+                interpretation_data: Dict[str, Any], report_type: str = 'full',
+                unbuffered: bool = False) -> Optional[str]:
     """
     Генерирует текстовый отчет (вместо PDF) и возвращает путь к файлу.
+    
+    При unbuffered=True отчет записывается в обход страничного кэша (для пакетной генерации).
     """
+    # Время составления отчета фиксируется один раз
+    now = datetime.now()
+    
     try:
         # Форматируем дату рождения, если она представлена строкой
         if isinstance(user_data.get('birthdate'), str):
             try:
-                birthdate = datetime.strptime(user_data['birthdate'], "%Y-%m-%d").date()
-                birthdate_formatted = birthdate.strftime('%d.%m.%Y')
+                birthdate_formatted = _format_date(_parse_iso(user_data['birthdate']))
             except (ValueError, TypeError):
                 birthdate_formatted = user_data.get('birthdate', '')
         else:
-            birthdate_formatted = user_data.get('birthdate', '').strftime('%d.%m.%Y') if user_data.get('birthdate') else ''
+            birthdate_formatted = _format_date(user_data.get('birthdate', '')) if user_data.get('birthdate') else ''
         
-        # Формируем имя файла
+        # Значения для шаблона: поля интерпретации и вычисленные поля отчета
+        ctx = defaultdict(str, interpretation_data)
+        ctx.setdefault('introduction', 'Нумерологический анализ на основе ваших персональных данных.')
+        ctx.setdefault('score', 0)
+        ctx.update(
+            fio=user_data.get('fio', 'Пользователь'),
+            birthdate_formatted=birthdate_formatted,
+            current_date=now.strftime('%d.%m.%Y'),
+            year=now.year,
+        )
+        ctx.update((key, numerology_data.get(key, '')) for _, key, _, _ in _NUMBER_FIELDS)
+        
+        template = _COMPAT_TEMPLATE if report_type == 'compatibility' else _FULL_TEMPLATE
+        
+        # Отчет формируется одним вызовом
+        data = template.format_map(ctx).encode('utf-8')
+        
+        # Если содержимое совпадает с последним отчетом пользователя и файл на месте, повторно не пишем
         user_id = user_data.get('id', 'unknown')
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        key = (user_id, report_type)
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        with _last_hash_lock:
+            cached = _last_hash.get(key)
+        if cached is not None and cached[0] == digest and os.path.exists(cached[1]):
+            logger.info(f"Отчет не изменился, используется ранее сгенерированный файл: {cached[1]}")
+            return cached[1]
+        
+        # Формируем имя файла
+        timestamp = now.strftime('%Y%m%d_%H%M%S')
         filename = f"{user_id}_{report_type}_{timestamp}.txt"
-        filepath = os.path.join(PDF_STORAGE_PATH, filename)
+        filepath = str(_STORAGE / filename)
+        
+        # Отчет записывается в файл одним вызовом
+        write = _write_report_direct if unbuffered else _write_report
+        write(filepath, data)
         
-        # Создаем текстовый отчет
-        with open(filepath, 'w', encoding='utf-8') as f:
-            # Заголовок
-            f.write(f"{'=' * 50}\n")
-            if report_type == 'compatibility':
-                f.write("ОТЧЕТ О НУМЕРОЛОГИЧЕСКОЙ СОВМЕСТИМОСТИ\n")
-            else:
-                f.write("НУМЕРОЛОГИЧЕСКИЙ ОТЧЕТ\n")
-            f.write(f"{'=' * 50}\n\n")
-            
-            # Информация о пользователе
-            f.write(f"Отчет для: {user_data.get('fio', 'Пользователь')}\n")
-            f.write(f"Дата рождения: {birthdate_formatted}\n")
-            f.write(f"Дата составления: {datetime.now().strftime('%d.%m.%Y')}\n\n")
-            
-            # Введение
-            f.write("ВВЕДЕНИЕ\n")
-            f.write(f"{'-' * 40}\n")
-            f.write(f"{interpretation_data.get('introduction', 'Нумерологический анализ на основе ваших персональных данных.')}\n\n")
-            
-            # Ключевые числа
-            f.write("КЛЮЧЕВЫЕ ЧИСЛА ВАШЕЙ СУДЬБЫ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            # Число жизненного пути
-            lp = numerology_data.get('life_path', '')
-            f.write(f"Число жизненного пути: {lp}\n")
-            f.write(f"{interpretation_data.get('life_path_interpretation', '')}\n\n")
-            
-            # Число выражения
-            exp = numerology_data.get('expression', '')
-            f.write(f"Число выражения: {exp}\n")
-            f.write(f"{interpretation_data.get('expression_interpretation', '')}\n\n")
-            
-            # Число души
-            soul = numerology_data.get('soul_urge', '')
-            f.write(f"Число души: {soul}\n")
-            f.write(f"{interpretation_data.get('soul_interpretation', '')}\n\n")
-            
-            # Число личности
-            pers = numerology_data.get('personality', '')
-            f.write(f"Число личности: {pers}\n")
-            f.write(f"{interpretation_data.get('personality_interpretation', '')}\n\n")
-            
-            # Подробный анализ
-            f.write("ПОДРОБНЫЙ АНАЛИЗ ЧИСЕЛ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            f.write(f"Число жизненного пути: {lp}\n")
-            f.write(f"{interpretation_data.get('life_path_detailed', '')}\n\n")
-            
-            f.write(f"Число выражения: {exp}\n")
-            f.write(f"{interpretation_data.get('expression_detailed', '')}\n\n")
-            
-            f.write(f"Число души: {soul}\n")
-            f.write(f"{interpretation_data.get('soul_detailed', '')}\n\n")
-            
-            f.write(f"Число личности: {pers}\n")
-            f.write(f"{interpretation_data.get('personality_detailed', '')}\n\n")
-            
-            # Дополнительная информация для отчета о совместимости
-            if report_type == 'compatibility':
-                f.write("АНАЛИЗ СОВМЕСТИМОСТИ\n")
-                f.write(f"{'-' * 40}\n")
-                
-                score = interpretation_data.get('score', 0)
-                f.write(f"Общая совместимость: {score}%\n\n")
-                
-                f.write("Сильные стороны отношений:\n")
-                f.write(f"{interpretation_data.get('strengths', '')}\n\n")
-                
-                f.write("Возможные трудности:\n")
-                f.write(f"{interpretation_data.get('challenges', '')}\n\n")
-                
-                f.write("Рекомендации:\n")
-                f.write(f"{interpretation_data.get('recommendations', '')}\n\n")
-            
-            # Прогноз и рекомендации
-            f.write("ПРОГНОЗ И РЕКОМЕНДАЦИИ\n")
-            f.write(f"{'-' * 40}\n")
-            
-            f.write(f"{interpretation_data.get('forecast', '')}\n\n")
-            
-            f.write("Личные рекомендации:\n")
-            f.write(f"{interpretation_data.get('recommendations', '')}\n\n")
-            
-            # Футер
-            f.write(f"{'=' * 50}\n")
-            f.write(f"© ИИ-Нумеролог {datetime.now().year}. Все права защищены.\n")
-            f.write("Данный отчет сгенерирован с использованием искусственного интеллекта.\n")
-            f.write("Для получения обновлений и еженедельных прогнозов подпишитесь в Telegram-боте.\n")
+        with _last_hash_lock:
+            _last_hash.pop(key, None)
+            _last_hash[key] = (digest, filepath)
+            # Самая давняя запись вытесняется первой (словарь хранит порядок вставки)
+            if len(_last_hash) > REPORT_HASH_CACHE_SIZE:
+                del _last_hash[next(iter(_last_hash))]
         
         logger.info(f"Текстовый отчет успешно сгенерирован: {filepath}")
         return filepath
@@ -2,11 +2,15 @@
 # Запускается через cron-задачу раз в неделю
 
 import asyncio
+import functools
 import logging
 import os
 import sys
+from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+
+import aiohttp
 
 # Настройка путей для импорта модулей из основного проекта
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -51,6 +55,18 @@ bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTM
 # Инициализация базы данных
 db = Database()
 
+# Сколько подписчиков обрабатывается одновременно (Telegram допускает около 30 сообщений в секунду)
+FORECAST_CONCURRENCY = int(os.getenv("FORECAST_CONCURRENCY", "20"))
+
+# Максимум одновременных соединений с n8n
+N8N_CONNECTION_LIMIT = 50
+
+# Число задач, отправляющих готовые прогнозы в Telegram
+FORECAST_SEND_WORKERS = int(os.getenv("FORECAST_SEND_WORKERS", "5"))
+
+# Размер очереди готовых прогнозов между генерацией и отправкой
+FORECAST_QUEUE_SIZE = 100
+
 
 async def get_active_subscribers() -> List[Dict[str, Any]]:
     """
@@ -60,39 +76,81 @@ async def get_active_subscribers() -> List[Dict[str, Any]]:
         List[Dict[str, Any]]: Список словарей с данными подписчиков
     """
     try:
-        # Инициализация базы данных
-        await db.init()
+        # Активные подписки вместе с данными пользователей получаются одним запросом
+        rows = await db.get_active_subscribers_with_users()
         
-        # Получение активных подписок
-        subscriptions = await db.get_active_subscriptions()
-        
-        # Получение данных пользователей для каждой подписки
-        subscribers = []
-        for subscription in subscriptions:
-            user_id = subscription.get("user_id")
-            user = await db.get_user_by_id(user_id)
-            
-            if user and user.get("push_enabled", True):
-                subscribers.append({
-                    "user_id": user_id,
-                    "tg_id": user.get("tg_id"),
-                    "fio": user.get("fio"),
-                    "birthdate": user.get("birthdate"),
-                    "subscription": subscription
-                })
-        
-        return subscribers
+        return [
+            {
+                "user_id": row.get("user_id"),
+                "tg_id": row.get("tg_id"),
+                "fio": row.get("fio"),
+                "birthdate": row.get("birthdate"),
+                "subscription": row
+            }
+            for row in rows
+        ]
     except Exception as e:
         logger.error(f"Ошибка при получении активных подписчиков: {e}")
         return []
 
 
-async def generate_weekly_forecast(user_data: Dict[str, Any]) -> Dict[str, Any]:
+def get_week_info(now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Вычисляет число недели и границы текущей недели.
+    Значения одинаковы для всех подписчиков, поэтому за запуск считаются один раз.
+    """
+    now = now or datetime.now()
+    current_week = now.isocalendar()[1]  # Номер недели в году
+    return {
+        # Расчет числа недели (от 1 до 9)
+        "week_number": calculate_digit_sum(current_week),
+        "year": now.year,
+        "date_from": (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d"),
+        "date_to": (now + timedelta(days=6-now.weekday())).strftime("%Y-%m-%d")
+    }
+
+
+@functools.lru_cache(maxsize=4096)
+def _personal_year(birthdate: str, year: int) -> int:
     """
-    Генерирует еженедельный прогноз для пользователя.
+    Число личного года с кешем по дате рождения.
+    get_personal_year зависит от текущего года, поэтому год входит в ключ кеша.
+    """
+    return get_personal_year(birthdate)
+
+
+async def _request_forecast(user: Dict[str, Any], personal_year: int, week: Dict[str, Any],
+                            session: Optional[aiohttp.ClientSession] = None) -> Dict[str, Any]:
+    """
+    Формирует запрос еженедельного прогноза и отправляет его на интерпретацию в n8n.
+    Единственное место, где задается формат запроса: его используют и прогноз
+    одного пользователя, и групповой прогноз.
+    """
+    forecast_data = {
+        "user": user,
+        "forecast": {
+            "week_number": week["week_number"],
+            "personal_year": personal_year,
+            "date_from": week["date_from"],
+            "date_to": week["date_to"]
+        }
+    }
+    
+    # Отправка данных на интерпретацию через n8n
+    return await send_to_n8n_for_interpretation(forecast_data, "weekly", session=session)
+
+
+async def generate_weekly_forecast(user_data: Dict[str, Any],
+                                   session: Optional[aiohttp.ClientSession] = None,
+                                   week: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Генерирует персональный еженедельный прогноз для одного пользователя.
+    Еженедельная рассылка использует generate_group_forecast.
     
     Args:
         user_data: Словарь с данными пользователя
+        session: Общая сессия aiohttp для запросов к n8n (необязательно)
+        week: Данные текущей недели из get_week_info (по умолчанию вычисляются заново)
         
     Returns:
         Dict[str, Any]: Словарь с прогнозом
@@ -106,46 +164,73 @@ async def generate_weekly_forecast(user_data: Dict[str, Any]) -> Dict[str, Any]:
             logger.warning(f"Недостаточно данных для пользователя {user_data.get('tg_id')}")
             return {"error": "Недостаточно данных для генерации прогноза"}
         
-        # Получение текущей даты
-        now = datetime.now()
-        current_week = now.isocalendar()[1]  # Номер недели в году
+        # Число и границы текущей недели
+        week = week or get_week_info()
         
-        # Расчет числа недели (от 1 до 9)
-        week_number = calculate_digit_sum(current_week)
-        
-        # Расчет личного года
-        personal_year = get_personal_year(birthdate)
-        
-        # Формирование данных для отправки на интерпретацию
-        forecast_data = {
-            "user": {
-                "fio": fio,
-                "birthdate": birthdate
-            },
-            "forecast": {
-                "week_number": week_number,
-                "personal_year": personal_year,
-                "date_from": (now - timedelta(days=now.weekday())).strftime("%Y-%m-%d"),
-                "date_to": (now + timedelta(days=6-now.weekday())).strftime("%Y-%m-%d")
-            }
-        }
+        # Расчет личного года (дата из PostgreSQL приходит объектом date)
+        personal_year = _personal_year(str(birthdate), week["year"])
         
-        # Отправка данных на интерпретацию через n8n
-        interpretation = await send_to_n8n_for_interpretation(forecast_data, "weekly")
-        
-        return interpretation
+        return await _request_forecast({"fio": fio, "birthdate": birthdate}, personal_year, week, session)
     except Exception as e:
         logger.error(f"Ошибка при генерации еженедельного прогноза: {e}")
         return {"error": f"Ошибка при генерации прогноза: {str(e)}"}
 
 
-async def send_forecast_to_user(tg_id: int, forecast: Dict[str, Any]) -> bool:
+# Имя в запросе группового прогноза: один текст получают все подписчики группы
+GROUP_FORECAST_NAME = "Подписчик"
+
+
+async def generate_group_forecast(personal_year: int, week: Dict[str, Any],
+                                  session: Optional[aiohttp.ClientSession] = None) -> Dict[str, Any]:
+    """
+    Генерирует еженедельный прогноз, общий для подписчиков с одинаковыми числом недели и личным годом.
+    Персональные данные в n8n не передаются, вместо имени используется GROUP_FORECAST_NAME.
+    
+    Args:
+        personal_year: Число личного года подписчиков группы
+        week: Данные текущей недели из get_week_info
+        session: Общая сессия aiohttp для запросов к n8n (необязательно)
+        
+    Returns:
+        Dict[str, Any]: Словарь с прогнозом
+    """
+    try:
+        return await _request_forecast({"fio": GROUP_FORECAST_NAME}, personal_year, week, session)
+    except Exception as e:
+        logger.error(f"Ошибка при генерации группового прогноза: {e}")
+        return {"error": f"Ошибка при генерации прогноза: {str(e)}"}
+
+
+# Завершение сообщения с прогнозом
+MESSAGE_SUFFIX = "\n\nХорошей недели! Ваш ИИ-Нумеролог."
+
+
+def get_message_frame(now: Optional[datetime] = None) -> Tuple[str, str]:
+    """
+    Формирует начало (заголовок с периодом недели) и конец сообщения с прогнозом.
+    Они одинаковы для всех подписчиков, поэтому за запуск формируются один раз.
+    """
+    now = now or datetime.now()
+    date_from = (now - timedelta(days=now.weekday())).strftime("%d.%m.%Y")
+    date_to = (now + timedelta(days=6-now.weekday())).strftime("%d.%m.%Y")
+    
+    prefix = (
+        f"🔮 <b>Ваш еженедельный нумерологический прогноз</b>\n"
+        f"<i>на период {date_from} - {date_to}</i>\n\n"
+    )
+    return prefix, MESSAGE_SUFFIX
+
+
+async def send_forecast_to_user(tg_id: int, forecast: Dict[str, Any],
+                                prefix: Optional[str] = None, suffix: str = MESSAGE_SUFFIX) -> bool:
     """
     Отправляет еженедельный прогноз пользователю.
     
     Args:
         tg_id: Telegram ID пользователя
         forecast: Словарь с прогнозом
+        prefix: Начало сообщения из get_message_frame (по умолчанию формируется заново)
+        suffix: Конец сообщения
         
     Returns:
         bool: True если отправка прошла успешно, False в противном случае
@@ -162,18 +247,10 @@ async def send_forecast_to_user(tg_id: int, forecast: Dict[str, Any]) -> bool:
             logger.warning(f"Пустой прогноз для пользователя {tg_id}")
             return False
         
-        # Получение текущей даты
-        now = datetime.now()
-        date_from = (now - timedelta(days=now.weekday())).strftime("%d.%m.%Y")
-        date_to = (now + timedelta(days=6-now.weekday())).strftime("%d.%m.%Y")
-        
         # Формирование сообщения
-        message = (
-            f"🔮 <b>Ваш еженедельный нумерологический прогноз</b>\n"
-            f"<i>на период {date_from} - {date_to}</i>\n\n"
-            f"{forecast_text}\n\n"
-            f"Хорошей недели! Ваш ИИ-Нумеролог."
-        )
+        if prefix is None:
+            prefix, suffix = get_message_frame()
+        message = prefix + forecast_text + suffix
         
         # Отправка сообщения пользователю
         await bot.send_message(chat_id=tg_id, text=message)
@@ -191,28 +268,76 @@ async def process_weekly_forecasts():
     try:
         logger.info("Начало отправки еженедельных прогнозов")
         
+        # Инициализация базы данных (один раз за запуск)
+        await db.init()
+        
         # Получение активных подписчиков
         subscribers = await get_active_subscribers()
         logger.info(f"Найдено {len(subscribers)} активных подписчиков")
         
-        # Обработка каждого подписчика
-        success_count = 0
+        # Число и границы недели, начало и конец сообщения общие для всех подписчиков
+        now = datetime.now()
+        week = get_week_info(now)
+        prefix, suffix = get_message_frame(now)
+        
+        # Генерация (n8n, секунды) и отправка (Telegram, ~100 мс) разделены очередью:
+        # прогнозы генерируются параллельно, не более FORECAST_CONCURRENCY одновременно,
+        # а FORECAST_SEND_WORKERS задач отправляют их по мере готовности
+        semaphore = asyncio.Semaphore(FORECAST_CONCURRENCY)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=FORECAST_QUEUE_SIZE)
+        
+        async def produce(personal_year: int, tg_ids: List[int]) -> None:
+            # Генерация прогноза, одного на группу
+            async with semaphore:
+                forecast = await generate_group_forecast(personal_year, week, session=session)
+            for tg_id in tg_ids:
+                await queue.put((tg_id, forecast))
+        
+        async def consume() -> int:
+            sent = 0
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return sent
+                tg_id, forecast = item
+                
+                # Отправка прогноза
+                if await send_forecast_to_user(tg_id, forecast, prefix, suffix):
+                    logger.info(f"Прогноз успешно отправлен пользователю {tg_id}")
+                    sent += 1
+                else:
+                    logger.warning(f"Не удалось отправить прогноз пользователю {tg_id}")
+        
+        # Прогноз зависит только от числа недели и личного года (не более 81 сочетания),
+        # поэтому подписчики группируются и n8n вызывается один раз на группу
+        groups: Dict[Tuple[int, int], List[int]] = defaultdict(list)
         for subscriber in subscribers:
             tg_id = subscriber.get("tg_id")
-            
             if not tg_id:
                 logger.warning(f"Не найден Telegram ID для пользователя {subscriber.get('user_id')}")
                 continue
+            birthdate = subscriber.get("birthdate")
+            if not birthdate or not subscriber.get("fio"):
+                logger.warning(f"Недостаточно данных для пользователя {tg_id}")
+                continue
             
-            # Генерация прогноза
-            forecast = await generate_weekly_forecast(subscriber)
+            # Расчет личного года (дата из PostgreSQL приходит объектом date)
+            personal_year = _personal_year(str(birthdate), week["year"])
+            groups[(week["week_number"], personal_year)].append(tg_id)
+        logger.info(f"Подписчики объединены в {len(groups)} групп прогнозов")
+        
+        # Все запросы к n8n идут через одну сессию с пулом keep-alive соединений
+        connector = aiohttp.TCPConnector(limit=N8N_CONNECTION_LIMIT, keepalive_timeout=60, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            consumers = [asyncio.create_task(consume()) for _ in range(FORECAST_SEND_WORKERS)]
+            producers = [asyncio.create_task(produce(personal_year, tg_ids))
+                         for (_, personal_year), tg_ids in groups.items()]
+            await asyncio.gather(*producers, return_exceptions=True)
             
-            # Отправка прогноза
-            if await send_forecast_to_user(tg_id, forecast):
-                success_count += 1
-                logger.info(f"Прогноз успешно отправлен пользователю {tg_id}")
-            else:
-                logger.warning(f"Не удалось отправить прогноз пользователю {tg_id}")
+            # По одному маркеру завершения на каждую задачу отправки
+            for _ in consumers:
+                await queue.put(None)
+            success_count = sum(await asyncio.gather(*consumers))
         
         logger.info(f"Отправка еженедельных прогнозов завершена. Успешно: {success_count}/{len(subscribers)}")
     except Exception as e: